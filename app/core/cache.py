@@ -0,0 +1,101 @@
+# Cache em memória (por processo) com TTL, despejo LRU e stale-while-revalidate
+# - Dentro do TTL "soft": devolve o valor direto
+# - Entre o TTL soft e o "stale": devolve o valor antigo e dispara UM refresh em background
+# - Depois do stale (ou sem entrada): busca de forma síncrona
+
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+Loader = Callable[[], Awaitable[Any]]
+
+
+@dataclass
+class _Entry:
+    value: Any
+    fresh_until: float
+    stale_until: float
+    stored_at: float
+
+
+class SWRCache:
+    def __init__(self, max_entries: int, ttl: float, stale_ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._data: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._refreshing: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def _store(self, key: Hashable, value: Any, ttl: float) -> None:
+        now = time.monotonic()
+        self._data[key] = _Entry(value, now + ttl, now + max(ttl, self.stale_ttl), now)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        # Lê sem disparar refresh (None se não existir ou já vencido)
+        entry = self._data.get(key)
+        if entry is None or entry.stale_until <= time.monotonic():
+            return None
+        return entry.value
+
+    def age(self, key: Hashable) -> Optional[float]:
+        # Segundos desde que a entrada foi gravada (None se não existir)
+        entry = self._data.get(key)
+        return None if entry is None else time.monotonic() - entry.stored_at
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    async def _refresh(self, key: Hashable, loader: Loader, ttl: float) -> None:
+        try:
+            self._store(key, await loader(), ttl)
+        except Exception:
+            # Mantém o valor antigo; o próximo acesso tenta de novo
+            logger.warning("Refresh em background falhou para %r", key, exc_info=True)
+        finally:
+            self._refreshing.pop(key, None)
+
+    async def get_or_load(self, key: Hashable, loader: Loader, ttl: Optional[float] = None) -> Any:
+        ttl = self.ttl if ttl is None else ttl
+        now = time.monotonic()
+        entry = self._data.get(key)
+
+        if entry is not None and now < entry.fresh_until:
+            self.hits += 1
+            self._data.move_to_end(key)
+            return entry.value
+
+        if entry is not None and now < entry.stale_until:
+            self.stale_hits += 1
+            self._data.move_to_end(key)
+            if key not in self._refreshing:
+                self._refreshing[key] = asyncio.create_task(self._refresh(key, loader, ttl))
+            return entry.value
+
+        self.misses += 1
+        value = await loader()
+        self._store(key, value, ttl)
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshing": len(self._refreshing),
+        }
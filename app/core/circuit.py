@@ -0,0 +1,54 @@
+# Circuit breaker por provedor
+# - Após N falhas seguidas o circuito abre e o provedor é pulado por um tempo
+# - Passado o tempo, uma chamada de teste (half-open) decide se fecha de novo
+
+from __future__ import annotations
+import time
+from typing import Dict
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.failure_threshold:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True  # só uma chamada de teste por vez
+            return True
+        return False
+
+    # Chamada terminou sem veredito (ex.: cancelada): libera a vaga de teste sem contar falha
+    def release(self) -> None:
+        self._probing = False
+
+    def on_success(self) -> None:
+        self.failures = 0
+        self._probing = False
+
+    def on_failure(self) -> None:
+        self._probing = False
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.failures == self.failure_threshold:
+                self.trips += 1
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, object]:
+        return {"state": self.state, "failures": self.failures, "trips": self.trips}
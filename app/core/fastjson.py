@@ -0,0 +1,45 @@
+# JSON rápido (orjson quando disponível) e corpos JSON já serializados
+# - RawJSON guarda os bytes do upstream; só faz parse se alguém pedir .data
+# - Rotas que devolvem RawJSON repassam os bytes sem parse/dump
+
+from __future__ import annotations
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class RawJSON:
+    __slots__ = ("body", "_data")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self._data: Any = None
+
+    @property
+    def data(self) -> Any:
+        # Parse preguiçoso (e único) para quem precisa do objeto Python
+        if self._data is None:
+            self._data = loads(self.body)
+        return self._data
+
+    @classmethod
+    def from_obj(cls, obj: Any) -> "RawJSON":
+        raw = cls(dumps(obj))
+        raw._data = obj
+        return raw
@@ -0,0 +1,142 @@
+# Governador de cota por serviço externo (token bucket)
+# - Cada upstream tem sua taxa (req/min) e uma rajada máxima
+# - Chamadas acima da taxa esperam na fila (até GOVERNOR_MAX_WAIT_SEC) em vez de falhar
+# - 429 com Retry-After pausa o upstream; sem Retry-After usa backoff exponencial
+# - Taxa 0 (ou negativa) desliga o limite de taxa; a pausa por 429 continua valendo
+
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional
+import httpx
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Cotas padrão (req/min); sobrescreva com UPSTREAM_RATE_PER_MIN=coingecko_pub:30,newsapi:4
+DEFAULT_RATES_PER_MIN: Dict[str, float] = {
+    "coingecko_pub": 30,
+    "coingecko_pro": 500,
+    "newsapi": 10,
+    "mailerlite": 120,
+    "resend": 120,
+}
+
+
+class QuotaWaitExceeded(RuntimeError):
+    """A espera por cota passaria do limite configurado."""
+
+    def __init__(self, name: str, wait: float):
+        super().__init__(f"Cota de {name} esgotada; nova tentativa em {wait:.1f}s")
+        self.name = name
+        self.wait = wait
+
+
+class QuotaGovernor:
+    def __init__(self, name: str, rate_per_min: float, burst: Optional[float] = None, max_wait: float = 10.0):
+        self.name = name
+        self.rate = max(0.0, rate_per_min) / 60.0  # tokens por segundo; 0 = sem limite (só respeita 429)
+        self.burst = burst if burst is not None else max(1.0, rate_per_min / 6)
+        self.max_wait = max_wait
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._backoff = 1.0
+        self._lock = asyncio.Lock()  # fila FIFO de quem espera
+        self.waiting = 0
+        self.throttled = 0
+        self.rejected = 0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        deadline = time.monotonic() + self.max_wait
+        self.waiting += 1
+        try:
+            async with self._lock:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = max(0.0, self._blocked_until - now)
+                    if wait == 0 and self.rate == 0:
+                        return
+                    if wait == 0 and self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    if wait == 0:
+                        wait = (1 - self.tokens) / self.rate
+                    if now + wait > deadline:
+                        self.rejected += 1
+                        raise QuotaWaitExceeded(self.name, wait)
+                    await asyncio.sleep(wait)
+        finally:
+            self.waiting -= 1
+
+    def on_throttled(self, retry_after: Optional[float]) -> None:
+        # Upstream devolveu 429: pausa e zera a rajada
+        self.throttled += 1
+        pause = retry_after if retry_after is not None else self._backoff
+        self._backoff = min(self._backoff * 2, 60.0)
+        self._blocked_until = max(self._blocked_until, time.monotonic() + pause)
+        self.tokens = 0.0
+        logger.warning("%s respondeu 429; pausando %.1fs", self.name, pause)
+
+    def on_success(self) -> None:
+        self._backoff = 1.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queue_depth": self.waiting,
+            "tokens": round(self.tokens, 2),
+            "blocked_for": round(max(0.0, self._blocked_until - time.monotonic()), 1),
+            "throttled": self.throttled,
+            "rejected": self.rejected,
+        }
+
+
+def _parse_retry_after(r: httpx.Response) -> Optional[float]:
+    raw = r.headers.get("Retry-After")
+    if not raw:
+        return None
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(raw).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+_governors: Dict[str, QuotaGovernor] = {}
+
+
+def get_governor(name: str) -> QuotaGovernor:
+    gov = _governors.get(name)
+    if gov is None:
+        rate = settings.UPSTREAM_RATE_PER_MIN.get(name, DEFAULT_RATES_PER_MIN.get(name, 60))
+        gov = QuotaGovernor(name, rate, max_wait=settings.GOVERNOR_MAX_WAIT_SEC)
+        _governors[name] = gov
+    return gov
+
+
+def governors_stats() -> Dict[str, Dict[str, float]]:
+    return {name: gov.stats() for name, gov in _governors.items()}
+
+
+# Envia pela cota do upstream; em 429 espera (Retry-After/backoff) e tenta de novo.
+# Devolve a última resposta (pode ser 429 se as tentativas acabarem).
+async def governed_request(name: str, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+    gov = get_governor(name)
+    for _ in range(1 + settings.GOVERNOR_MAX_RETRIES):
+        await gov.acquire()
+        r = await send()
+        if r.status_code != 429:
+            gov.on_success()
+            return r
+        gov.on_throttled(_parse_retry_after(r))
+    return r
@@ -0,0 +1,75 @@
+# Registro de clientes HTTP compartilhados (um pool keep-alive por serviço externo)
+# - Criado no lifespan do app/main.py e fechado no shutdown
+# - Evita pagar DNS + TCP + TLS a cada chamada para CoinGecko, NewsAPI, MailerLite e Resend
+
+from __future__ import annotations
+import logging
+from typing import Dict, Optional
+import httpx
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Nome do upstream -> (base_url, usa HTTP/2)
+UPSTREAMS: Dict[str, tuple[str, bool]] = {
+    "coingecko_pro": ("https://pro-api.coingecko.com/api/v3", True),
+    "coingecko_pub": ("https://api.coingecko.com/api/v3", True),
+    "newsapi": ("https://newsapi.org/v2", True),
+    "mailerlite": ("https://connect.mailerlite.com/api", True),
+    "resend": ("https://api.resend.com", True),
+    "feeds": ("", True),  # feeds RSS/Atom (URLs absolutas, vários hosts)
+}
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _http2_available() -> bool:
+    # HTTP/2 depende do pacote "h2" (httpx[http2]); sem ele cai para HTTP/1.1
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _make_client(name: str) -> httpx.AsyncClient:
+    base_url, wants_http2 = UPSTREAMS[name]
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT)
+    return httpx.AsyncClient(
+        base_url=base_url,
+        http2=settings.HTTP2_ENABLED and wants_http2 and _http2_available(),
+        limits=limits,
+        timeout=timeout,
+    )
+
+
+async def init_http_clients() -> None:
+    # Abre um cliente por upstream (chamado no startup)
+    for name in UPSTREAMS:
+        if name not in _clients:
+            _clients[name] = _make_client(name)
+    logger.info("Clientes HTTP inicializados: %s", ", ".join(_clients))
+
+
+async def close_http_clients() -> None:
+    # Fecha todos os pools (chamado no shutdown)
+    while _clients:
+        _, client = _clients.popitem()
+        try:
+            await client.aclose()
+        except Exception:
+            logger.exception("Falha ao fechar cliente HTTP")
+
+
+def get_client(name: str) -> httpx.AsyncClient:
+    # Retorna o cliente do upstream; cria sob demanda se o lifespan não rodou (ex.: scripts/jobs)
+    client: Optional[httpx.AsyncClient] = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _make_client(name)
+        _clients[name] = client
+    return client
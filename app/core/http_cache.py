@@ -0,0 +1,140 @@
+# Respostas JSON com ETag forte, 304 (If-None-Match), Cache-Control e compressão
+# - O corpo/ETag de um conteúdo em cache é calculado uma vez (memo por chave + versão)
+# - Bytes comprimidos (gzip/brotli) também ficam guardados por variante, cada uma com seu ETag
+
+from __future__ import annotations
+import gzip
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+from fastapi import Request, Response
+from app.core.fastjson import RawJSON, dumps
+
+try:  # brotli é opcional
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+MIN_COMPRESS_BYTES = 1024
+_MEMO_MAX = 1024
+_ETAG_SUFFIX = {"br": "-br", "gzip": "-gz"}
+
+
+class _Encoded:
+    __slots__ = ("version", "obj", "body", "etag", "variants")
+
+    def __init__(self, version: Hashable, obj: Any, body: bytes):
+        self.version = version
+        self.obj = obj  # mantém a referência viva (version padrão é id(obj))
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.variants: Dict[str, bytes] = {}
+
+    # Cada variante é uma representação diferente: ETag próprio ("...-br", "...-gz")
+    def etag_for(self, encoding: Optional[str]) -> str:
+        if encoding is None:
+            return self.etag
+        return self.etag[:-1] + _ETAG_SUFFIX[encoding] + '"'
+
+    def variant(self, encoding: str) -> bytes:
+        data = self.variants.get(encoding)
+        if data is None:
+            if encoding == "br":
+                data = brotli.compress(self.body, quality=5)
+            else:
+                data = gzip.compress(self.body, compresslevel=6)
+            self.variants[encoding] = data
+        return data
+
+
+_memo: "OrderedDict[Hashable, _Encoded]" = OrderedDict()
+
+
+def _dumps(obj: Any) -> bytes:
+    # RawJSON já está serializado: repassa os bytes
+    return obj.body if isinstance(obj, RawJSON) else dumps(obj)
+
+
+def _encode(obj: Any, memo_key: Optional[Hashable], version: Optional[Hashable]) -> _Encoded:
+    version = id(obj) if version is None else version
+    if memo_key is None:
+        return _Encoded(version, obj, _dumps(obj))
+    entry = _memo.get(memo_key)
+    if entry is None or entry.version != version:
+        entry = _Encoded(version, obj, _dumps(obj))
+        _memo[memo_key] = entry
+        while len(_memo) > _MEMO_MAX:
+            _memo.popitem(last=False)
+    _memo.move_to_end(memo_key)
+    return entry
+
+
+# Accept-Encoding com q-values ("gzip;q=0" recusa gzip; "*" vale para o que não foi citado)
+def _accepted(header: str) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        out[coding] = q
+    return out
+
+
+def _pick_encoding(request: Request) -> Optional[str]:
+    accepted = _accepted(request.headers.get("accept-encoding", ""))
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for encoding in (("br",) if brotli is not None else ()) + ("gzip",):  # empate: brotli
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    raw = request.headers.get("if-none-match")
+    if not raw:
+        return False
+    if raw.strip() == "*":
+        return True
+    # Aceita ETags fracas ("W/") enviadas por proxies que recomprimem
+    tags = {t.strip().removeprefix("W/") for t in raw.split(",")}
+    return etag in tags
+
+
+def cached_json_response(
+    request: Request,
+    obj: Any,
+    max_age: float,
+    memo_key: Optional[Hashable] = None,
+    version: Optional[Hashable] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    entry = _encode(obj, memo_key, version)
+    encoding = _pick_encoding(request) if len(entry.body) >= MIN_COMPRESS_BYTES else None
+    etag = entry.etag_for(encoding)
+    base = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max(0, int(max_age))}",
+        "Vary": "Accept-Encoding",
+        **(headers or {}),
+    }
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=base)
+
+    if encoding:
+        return Response(
+            content=entry.variant(encoding),
+            media_type="application/json",
+            headers={**base, "Content-Encoding": encoding},
+        )
+    return Response(content=entry.body, media_type="application/json", headers=base)
@@ -0,0 +1,104 @@
+# Cache do usuário autenticado (id do JWT -> principal)
+# - Evita um SELECT em users a cada requisição autenticada
+# - TTL curto e tamanho limitado; ids desconhecidos também ficam em cache (negativo)
+# - Com AUTH_CACHE_REDIS=true e REDIS_URL, o cache é compartilhado entre workers
+
+from __future__ import annotations
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Optional, Tuple, Union
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()  # não está no cache
+_NEGATIVE = "-"      # usuário inexistente (cache negativo)
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: uuid.UUID
+    email: str
+    name: Optional[str] = None
+
+
+Cached = Union[Principal, None, object]  # object = MISSING
+
+
+class PrincipalCache:
+    def __init__(self, max_entries: int, ttl: float, negative_ttl: float, redis_url: str = ""):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data: "OrderedDict[str, Tuple[float, Optional[Principal]]]" = OrderedDict()
+        self._redis = None
+        if redis_url:
+            try:
+                import redis.asyncio as redis
+                self._redis = redis.from_url(redis_url, decode_responses=True, socket_timeout=0.5)
+            except Exception:
+                logger.warning("Cache de principal: Redis indisponível, usando só memória", exc_info=True)
+
+    def _key(self, user_id: str) -> str:
+        return f"principal:{user_id}"
+
+    async def get(self, user_id: str) -> Cached:
+        # Devolve Principal, None (negativo) ou MISSING
+        if self._redis is not None:
+            try:
+                raw = await self._redis.get(self._key(user_id))
+            except Exception:
+                return MISSING
+            if raw is None:
+                return MISSING
+            if raw == _NEGATIVE:
+                return None
+            data = json.loads(raw)
+            return Principal(id=uuid.UUID(data["id"]), email=data["email"], name=data.get("name"))
+
+        item = self._data.get(user_id)
+        if item is None:
+            return MISSING
+        expires, principal = item
+        if expires <= time.monotonic():
+            del self._data[user_id]
+            return MISSING
+        self._data.move_to_end(user_id)
+        return principal
+
+    async def put(self, user_id: str, principal: Optional[Principal]) -> None:
+        ttl = self.ttl if principal is not None else self.negative_ttl
+        if self._redis is not None:
+            try:
+                value = _NEGATIVE if principal is None else json.dumps(asdict(principal), default=str)
+                await self._redis.set(self._key(user_id), value, ex=max(1, int(ttl)))
+            except Exception:
+                logger.warning("Cache de principal: falha ao gravar no Redis", exc_info=True)
+            return
+
+        self._data[user_id] = (time.monotonic() + ttl, principal)
+        self._data.move_to_end(user_id)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    async def invalidate(self, user_id: str) -> None:
+        # Chamado quando o usuário muda (ex.: reset de senha)
+        user_id = str(user_id)
+        self._data.pop(user_id, None)
+        if self._redis is not None:
+            try:
+                await self._redis.delete(self._key(user_id))
+            except Exception:
+                logger.warning("Cache de principal: falha ao invalidar no Redis", exc_info=True)
+
+
+principal_cache = PrincipalCache(
+    max_entries=settings.AUTH_CACHE_MAX_ENTRIES,
+    ttl=settings.AUTH_CACHE_TTL,
+    negative_ttl=settings.AUTH_CACHE_NEGATIVE_TTL,
+    redis_url=settings.REDIS_URL if settings.AUTH_CACHE_REDIS else "",
+)
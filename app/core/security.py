@@ -1,9 +1,14 @@
 # app/core/security.py
 
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+import time
 from passlib.hash import bcrypt as bcrypt_hash
 import jwt
 import hashlib
+import hmac
 from app.core.config import settings
 
 def _bcrypt_safe(password: str) -> str:
@@ -20,13 +25,73 @@ def _bcrypt_safe(password: str) -> str:
 def hash_password(password: str) -> str:
     """Hash com bcrypt (sem lançar erro >72 bytes)."""
     safe = _bcrypt_safe(password)
-    return bcrypt_hash.using(ident="2b", rounds=12, truncate_error=False).hash(safe)
+    return bcrypt_hash.using(ident="2b", rounds=settings.BCRYPT_ROUNDS, truncate_error=False).hash(safe)
 
 def verify_password(password: str, password_hash: str) -> bool:
     """Verify com bcrypt (sem lançar erro >72 bytes)."""
     safe = _bcrypt_safe(password)
     return bcrypt_hash.using(truncate_error=False).verify(safe, password_hash)
 
+def password_needs_rehash(password_hash: str) -> bool:
+    """True se o hash foi gerado com custo (rounds) diferente do configurado."""
+    return bcrypt_hash.using(ident="2b", rounds=settings.BCRYPT_ROUNDS).needs_update(password_hash)
+
+# ===== Pool dedicado para bcrypt =====
+# bcrypt libera o GIL: threads próprias bastam, sem disputar o threadpool das rotas síncronas.
+# Acima de BCRYPT_WORKERS + BCRYPT_QUEUE_LIMIT pedidos pendentes, rejeita na hora.
+
+class PasswordPoolBusy(RuntimeError):
+    """Pool de bcrypt saturado."""
+
+_bcrypt_pool = ThreadPoolExecutor(max_workers=settings.BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_bcrypt_pending = 0
+_bcrypt_timings: deque = deque(maxlen=512)  # (espera na fila, execução) em ms
+_bcrypt_rejected = 0
+
+async def _run_bcrypt(fn, *args):
+    global _bcrypt_pending, _bcrypt_rejected
+    if _bcrypt_pending >= settings.BCRYPT_WORKERS + settings.BCRYPT_QUEUE_LIMIT:
+        _bcrypt_rejected += 1
+        raise PasswordPoolBusy("Muitas requisições de login no momento. Tente novamente.")
+    _bcrypt_pending += 1
+    queued = time.perf_counter()
+
+    def timed():
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            _bcrypt_timings.append(((started - queued) * 1000, (time.perf_counter() - started) * 1000))
+
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_bcrypt_pool, timed)
+    finally:
+        _bcrypt_pending -= 1
+
+async def hash_password_async(password: str) -> str:
+    return await _run_bcrypt(hash_password, password)
+
+async def verify_password_async(password: str, password_hash: str) -> bool:
+    return await _run_bcrypt(verify_password, password, password_hash)
+
+def bcrypt_stats() -> dict:
+    # Tempos em ms (p50/p95) das últimas operações, para calibrar BCRYPT_ROUNDS
+    def pct(values, p):
+        return round(values[min(len(values) - 1, int(len(values) * p))], 1) if values else None
+    waits = sorted(w for w, _ in _bcrypt_timings)
+    runs = sorted(r for _, r in _bcrypt_timings)
+    return {
+        "rounds": settings.BCRYPT_ROUNDS,
+        "workers": settings.BCRYPT_WORKERS,
+        "pending": _bcrypt_pending,
+        "rejected": _bcrypt_rejected,
+        "samples": len(runs),
+        "wait_ms_p50": pct(waits, 0.5),
+        "wait_ms_p95": pct(waits, 0.95),
+        "run_ms_p50": pct(runs, 0.5),
+        "run_ms_p95": pct(runs, 0.95),
+    }
+
 # ===== JWT =====
 def create_access_token(subject: str) -> str:
     expire = datetime.now(timezone.utc) + timedelta(
@@ -41,3 +106,26 @@ def decode_token(token: str) -> dict:
 # ===== SHA-256 =====
 def sha256_hex(value: str) -> str:
     return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+# ===== Descadastro da newsletter =====
+# Token "emitido_em.hmac" (HMAC com SECRET_KEY sobre versão, e-mail e data): funciona sem login,
+# mas expira (NEWSLETTER_UNSUBSCRIBE_TTL_DAYS); trocar UNSUBSCRIBE_TOKEN_VERSION invalida todos
+UNSUBSCRIBE_TOKEN_VERSION = 1
+
+def _unsubscribe_mac(email: str, issued_at: int) -> str:
+    msg = f"unsubscribe:v{UNSUBSCRIBE_TOKEN_VERSION}:{email.strip().lower()}:{issued_at}".encode("utf-8")
+    return hmac.new(settings.SECRET_KEY.encode("utf-8"), msg, hashlib.sha256).hexdigest()[:32]
+
+def unsubscribe_token(email: str) -> str:
+    issued_at = int(time.time())
+    return f"{issued_at}.{_unsubscribe_mac(email, issued_at)}"
+
+def verify_unsubscribe_token(email: str, token: str) -> bool:
+    issued, _, mac = token.strip().partition(".")
+    try:
+        issued_at = int(issued)
+    except ValueError:
+        return False
+    if time.time() - issued_at > settings.NEWSLETTER_UNSUBSCRIBE_TTL_DAYS * 86400:
+        return False
+    return hmac.compare_digest(_unsubscribe_mac(email, issued_at), mac)
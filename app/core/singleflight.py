@@ -0,0 +1,49 @@
+# Coalescência de chamadas idênticas em andamento ("single-flight")
+# - A primeira chamada para uma chave executa; as concorrentes aguardam o mesmo resultado
+# - Erros também são compartilhados (todas recebem a mesma exceção)
+
+from __future__ import annotations
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Mapping, Optional
+
+
+def make_key(url: str, params: Optional[Mapping[str, Any]] = None) -> tuple:
+    # Chave estável: URL + params ordenados
+    return (url, tuple(sorted((str(k), str(v)) for k, v in (params or {}).items())))
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.executed = 0
+        self.deduplicated = 0
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Marca a exceção como lida mesmo se ninguém mais estiver aguardando
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.executed += 1
+            # Roda como task: cancelar quem chegou primeiro não cancela os demais
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        else:
+            self.deduplicated += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "calls": self.calls,
+            "executed": self.executed,
+            "deduplicated": self.deduplicated,
+            "inflight": len(self._inflight),
+        }
@@ -1,9 +1,12 @@
 ##Conexão com o banco (SQLAlchemy) e criação de tabelas.
 
 from __future__ import annotations
-from typing import Generator, Optional
+from typing import AsyncGenerator, Generator, Optional
 import logging
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from fastapi import HTTPException
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase, Session
 from app.core.config import settings
 
@@ -47,6 +50,37 @@ SessionLocal: Optional[sessionmaker[Session]] = (
 )
 
 
+# Converte a URL do psycopg2 para asyncpg:
+   # - postgresql:// -> postgresql+asyncpg://
+   # - sslmode=require -> ssl=require (asyncpg não entende sslmode)
+   # - desliga cache de prepared statements (pooler do Supabase em modo transação)
+def _async_url(url: str) -> str:
+    parts = urlsplit(_ensure_ssl(url))
+    scheme = "postgresql+asyncpg"
+    query = []
+    for k, v in parse_qsl(parts.query):
+        query.append(("ssl", v) if k == "sslmode" else (k, v))
+    query.append(("prepared_statement_cache_size", "0"))
+    return urlunsplit((scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+def _make_async_engine(db_url: str):
+    return create_async_engine(
+        _async_url(db_url),
+        pool_pre_ping=True,
+        pool_size=settings.DB_ASYNC_POOL_SIZE,
+        max_overflow=settings.DB_ASYNC_MAX_OVERFLOW,
+        connect_args={"statement_cache_size": 0},
+    )
+
+_async_engine = _make_async_engine(settings.DATABASE_URL) if settings.DATABASE_URL else None
+
+AsyncSessionLocal: Optional[async_sessionmaker[AsyncSession]] = (
+    async_sessionmaker(bind=_async_engine, autoflush=False, expire_on_commit=False)
+    if _async_engine
+    else None
+)
+
+
 class Base(DeclarativeBase):
     """Base declarativa para todos os modelos ORM."""
     pass
@@ -61,6 +95,19 @@ def get_db() -> Generator[Session, None, None]:
     finally:
         db.close()
 
+# Versão assíncrona (asyncpg): não bloqueia o event loop nem depende do threadpool
+# Sem DATABASE_URL as rotas que dependem do banco respondem 503 (não 500)
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    if AsyncSessionLocal is None:
+        raise HTTPException(status_code=503, detail="Banco de dados não configurado")
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Fecha o pool assíncrono no shutdown
+async def dispose_async_engine() -> None:
+    if _async_engine is not None:
+        await _async_engine.dispose()
+
 # Cria as tabelas definidas nos modelos registrados
 # Faz import tardio de app.db.models para garantir o registro e loga o resultado
 def create_all() -> None:
@@ -69,4 +116,8 @@ def create_all() -> None:
         return
     from app.db import models
     Base.metadata.create_all(bind=_engine)
+    # create_all não adiciona índices novos em tabelas que já existem
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=_engine, checkfirst=True)
     logger.info("Tabelas verificadas/criadas com sucesso.")
@@ -1,6 +1,6 @@
 #Modelo das tabelas do banco de dados
 
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, String, Boolean, DateTime, Float, ForeignKey, Index, Text, UniqueConstraint, func, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from datetime import datetime
@@ -30,12 +30,19 @@ class PasswordReset(Base):
         nullable=False,
         index=True,
     )
-    token_hash = Column(String(128), nullable=False, index=True)
+    token_hash = Column(String(128), nullable=False)
     expires_at = Column(DateTime(timezone=True), nullable=False)
     used_at = Column(DateTime(timezone=True), nullable=True)
 
     user = relationship("User")
 
+    # Índices parciais só com tokens ainda não usados (ficam pequenos mesmo com a tabela crescendo)
+    __table_args__ = (
+        Index("ix_password_resets_live_token", "token_hash", "expires_at", postgresql_where=text("used_at IS NULL")),
+        Index("ix_password_resets_live_user", "user_id", "expires_at", postgresql_where=text("used_at IS NULL")),
+        Index("ix_password_resets_expires_at", "expires_at"),  # purge por expiração
+    )
+
 
 class Favorite(Base):
     __tablename__ = "favorites"
@@ -55,3 +62,108 @@ class NewsletterSubscription(Base):
     email: Mapped[str] = mapped_column(String, nullable=False, unique=True)
     consent: Mapped[bool] = mapped_column(Boolean, default=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+# Outbox da newsletter: inscrição gravada localmente e sincronizada com a MailerLite pelo scheduler.
+# Uma linha por e-mail (idempotente); status: pending -> synced | failed
+class NewsletterOutbox(Base):
+    __tablename__ = "newsletter_outbox"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    email: Mapped[str] = mapped_column(String, nullable=False, unique=True)
+    name: Mapped[str | None] = mapped_column(String, nullable=True)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="pending")
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_error: Mapped[str | None] = mapped_column(String, nullable=True)
+    provider_id: Mapped[str | None] = mapped_column(String, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    synced_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    # O worker só varre as pendentes
+    __table_args__ = (
+        Index("ix_newsletter_outbox_pending", "next_attempt_at", postgresql_where=text("status = 'pending'")),
+    )
+
+# Fila persistente de e-mails (entrega pelo scheduler, ao menos uma vez)
+# dedupe_key opcional evita enfileirar a mesma mensagem duas vezes (ex.: digest da semana)
+# O corpo é apagado após o envio (pode conter links com token)
+class MailQueue(Base):
+    __tablename__ = "mail_queue"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    to_email: Mapped[str] = mapped_column(String, nullable=False)
+    subject: Mapped[str] = mapped_column(String, nullable=False)
+    html: Mapped[str | None] = mapped_column(Text, nullable=True)
+    kind: Mapped[str] = mapped_column(String(32), nullable=False, default="")
+    ref_id: Mapped[int | None] = mapped_column(Integer, nullable=True)  # ex.: password_resets.id (HTML gerado no envio)
+    dedupe_key: Mapped[str | None] = mapped_column(String, nullable=True, unique=True)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="pending")
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_error: Mapped[str | None] = mapped_column(String, nullable=True)
+    provider: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_mail_queue_pending", "next_attempt_at", postgresql_where=text("status = 'pending'")),
+        Index("ix_mail_queue_created_at", "created_at"),  # retenção
+    )
+
+# Checkpoint do digest semanal: uma linha por semana ISO ("2026-W42")
+# last_subscription_id = último inscrito já processado (retomada após queda)
+# lease_until impede dois workers de enviarem a mesma semana ao mesmo tempo
+# lease_token identifica o dono do lease: checkpoint de quem perdeu o lease não grava nada
+class DigestRun(Base):
+    __tablename__ = "digest_runs"
+    week: Mapped[str] = mapped_column(String(10), primary_key=True)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="running")  # running | done
+    last_subscription_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), nullable=True)
+    sent: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    queued: Mapped[int] = mapped_column(Integer, nullable=False, default=0)  # falhas entregues à fila de e-mails
+    lease_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)  # worker dono da execução
+    lease_token: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+# Acervo de notícias (NewsAPI), uma linha por URL (sha256 da URL normalizada)
+# Leitura paginada por (language, published_at, url_hash) em ordem decrescente
+class NewsArticle(Base):
+    __tablename__ = "news_articles"
+    url_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    url: Mapped[str] = mapped_column(String, nullable=False)
+    title: Mapped[str] = mapped_column(String, nullable=False)
+    source: Mapped[str] = mapped_column(String, nullable=False, default="")
+    image: Mapped[str | None] = mapped_column(String, nullable=True)
+    language: Mapped[str] = mapped_column(String(8), nullable=False)
+    published_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    fetched_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_news_articles_lang_published", "language", "published_at", "url_hash"),
+        Index("ix_news_articles_published", "published_at"),  # retenção
+    )
+
+# Estado de cada feed RSS/Atom: validadores do GET condicional e última entrada já lida
+class NewsFeed(Base):
+    __tablename__ = "news_feeds"
+    url: Mapped[str] = mapped_column(String, primary_key=True)
+    etag: Mapped[str | None] = mapped_column(String, nullable=True)
+    last_modified: Mapped[str | None] = mapped_column(String, nullable=True)
+    last_entry_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_status: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    last_polled_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # url_hash (separados por espaço) das entradas já lidas no instante last_entry_at e das sem data
+    seen_hashes: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+# Histórico de preços em candles OHLC (1m / 1h / 1d), alimentado pelo snapshot de mercados.
+# Chave primária composta = índice para leitura por intervalo de tempo.
+class PriceCandle(Base):
+    __tablename__ = "price_candles"
+    coin_id: Mapped[str] = mapped_column(String, primary_key=True)
+    vs_currency: Mapped[str] = mapped_column(String(8), primary_key=True)
+    interval: Mapped[str] = mapped_column(String(4), primary_key=True)  # "1m", "1h", "1d"
+    bucket_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    open: Mapped[float] = mapped_column(Float, nullable=False)
+    high: Mapped[float] = mapped_column(Float, nullable=False)
+    low: Mapped[float] = mapped_column(Float, nullable=False)
+    close: Mapped[float] = mapped_column(Float, nullable=False)
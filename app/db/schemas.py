@@ -1,7 +1,7 @@
 #Pydantic vai validar dados de entrada/saída nas rotas
 
 # Auth
-from typing import Optional, Any
+from typing import Optional, Any, Literal
 from uuid import UUID
 from pydantic import BaseModel, EmailStr, ConfigDict, field_validator,Field
 from datetime import datetime
@@ -40,6 +40,23 @@ class FavoriteOut(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+class FavoritesBulkIn(BaseModel):
+    coin_ids: list[str]
+
+class FavoriteBulkResult(BaseModel):
+    coin_id: str
+    status: Literal["added", "exists", "removed", "not_found", "kept"]
+
+class FavoritesBulkOut(BaseModel):
+    results: list[FavoriteBulkResult]
+    added: int = 0
+    removed: int = 0
+
+class FavoriteWithPriceOut(BaseModel):
+    coin_id: str
+    added_at: datetime | None = None
+    market: dict[str, Any] | None = None  # payload compacto (None se a moeda não foi encontrada)
+
 # Newsletter
 class NewsletterSubscribeIn(BaseModel):
     email: EmailStr
@@ -4,6 +4,7 @@
 # - Ativa CORS para o seu front-end
 
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
@@ -11,8 +12,10 @@ load_dotenv()
 
 
 from app.core.config import settings
+from app.core.http import init_http_clients, close_http_clients
 from app.core.rate_limit import init_rate_limit
-from app.db.database import create_all
+from app.db.database import create_all, dispose_async_engine
+from app.services.email import mailer
 from app.routers import auth, favorites, news, prices, newsletter, users
 from app.tasks.scheduler import start_scheduler, shutdown_scheduler
 
@@ -20,13 +23,18 @@ from app.tasks.scheduler import start_scheduler, shutdown_scheduler
 async def lifespan(app: FastAPI):
     # Startup
     create_all()                # cria tabelas se DATABASE_URL estiver setado
+    await init_http_clients()   # abre os pools HTTP compartilhados
     await init_rate_limit()     # ativa rate limit se REDIS_URL existir
     await start_scheduler()     # inicia jobs do APScheduler
     yield
     # Shutdown
     await shutdown_scheduler()
+    await mailer.close()        # encerra as sessões SMTP abertas
+    await close_http_clients()
+    await dispose_async_engine()
 
-app = FastAPI(title="infoCripto API", lifespan=lifespan)
+# ORJSONResponse: serialização mais rápida para todas as rotas que devolvem dict/list
+app = FastAPI(title="infoCripto API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # CORS — permita seu front (Vercel).
 app.add_middleware(
@@ -35,6 +43,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Headers que o front lê em chamadas cross-origin (paginação, cache, frescor do dado)
+    expose_headers=["ETag", "X-Next-Cursor", "X-Data-Source", "X-Data-Age", "X-Data-Fetched-At", "Retry-After"],
 )
 
 # Rotas da API (prefixo configurável por API_PREFIX)
@@ -50,4 +60,27 @@ async def root():
     # Endpoint simples para ver se a API está no ar
     return {"ok": True, "message": "infoCripto API rodando"}
 
+@app.get("/stats")
+async def stats():
+    # Contadores internos (cache e deduplicação de chamadas aos serviços externos)
+    from app.services.coingecko import markets_cache, coingecko_flight
+    from app.services.news_service import news_flight
+    from app.services.coin_index import coin_index
+    from app.services.news_store import news_store
+    from app.services.market_snapshot import market_snapshots
+    from app.core.governor import governors_stats
+    from app.services.price_stream import price_broadcaster
+    from app.core.security import bcrypt_stats
+    return {
+        "bcrypt": bcrypt_stats(),
+        "mailer": mailer.stats(),
+        "price_stream_subscribers": price_broadcaster.stats(),
+        "governors": governors_stats(),
+        "market_snapshots": market_snapshots.stats(),
+        "markets_cache": markets_cache.stats(),
+        "coin_index": coin_index.stats(),
+        "news_store": news_store.stats(),
+        "singleflight": {f.name: f.stats() for f in (coingecko_flight, news_flight)},
+    }
+
 app.include_router(users.router)
@@ -5,14 +5,16 @@ Rotas de autenticação:
 - /auth/forgot-password
 - /auth/reset-password
 """
+import logging
 import os
-import secrets
 from datetime import datetime, timedelta, timezone
 
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.database import get_db
+from app.db.database import get_async_db
 from app.db.models import User, PasswordReset
 from app.db import models
 from app.db.schemas import (
@@ -23,93 +25,139 @@ from app.db.schemas import (
     ResetPasswordIn,
 )
 from app.core.security import (
-    hash_password,
-    verify_password,
+    PasswordPoolBusy,
+    hash_password_async,
+    verify_password_async,
+    password_needs_rehash,
     create_access_token,
     sha256_hex,
 )
+from app.core.config import settings
+from app.core.principal_cache import principal_cache
 from app.services.email import send_email
+from app.services.mail_queue import enqueue_mail, kick_dispatch
+from app.services import password_reset_mail as reset_mail
 
 router = APIRouter(prefix="/auth", tags=["auth"])
-
-# === ENVs ===
-FRONTEND_RESET_URL = os.getenv("FRONTEND_RESET_URL", "http://localhost:3000/resetar-senha")
-RESET_TOKEN_TTL_MIN = int(os.getenv("RESET_TOKEN_TTL_MIN", "30"))
+logger = logging.getLogger(__name__)
 
 # Flags de debug (para testes)
 DEBUG_RETURN_RESET_LINK = os.getenv("DEBUG_RETURN_RESET_LINK", "false").lower() == "true"
 DEBUG_SYNC_EMAIL = os.getenv("DEBUG_SYNC_EMAIL", "false").lower() == "true"
 
 
+# bcrypt roda no pool dedicado; pool saturado responde 503 na hora em vez de enfileirar sem limite
+async def _hash(password: str) -> str:
+    try:
+        return await hash_password_async(password)
+    except PasswordPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+async def _verify(password: str, password_hash: str) -> bool:
+    try:
+        return await verify_password_async(password, password_hash)
+    except PasswordPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+
 @router.post("/register", response_model=UserOut)
-def register(payload: UserCreate, db: Session = Depends(get_db)):
-    exists = db.query(models.User).filter(models.User.email == payload.email).first()
-    if exists:
-        raise HTTPException(status_code=400, detail="E-mail já cadastrado")
-    user = models.User(
-        email=payload.email,
-        name=payload.name,
-        password_hash=hash_password(payload.password),
+async def register(payload: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    password_hash = await _hash(payload.password)
+    # Um único INSERT ... ON CONFLICT (email) DO NOTHING RETURNING: sem SELECT prévio nem refresh
+    stmt = (
+        pg_insert(models.User)
+        .values(email=payload.email, name=payload.name, password_hash=password_hash)
+        .on_conflict_do_nothing(index_elements=[models.User.email])
+        .returning(models.User.id, models.User.email, models.User.name)
     )
-    db.add(user)
-    db.commit()
-    db.refresh(user)
-    return user
+    row = (await db.execute(stmt)).first()
+    await db.commit()
+    if row is None:
+        raise HTTPException(status_code=400, detail="E-mail já cadastrado")
+    return {"id": row.id, "email": row.email, "name": row.name}
 
 
 @router.post("/login", response_model=TokenOut)
-def login(payload: UserCreate, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == payload.email).first()
-    if not user or not user.password_hash or not verify_password(payload.password, user.password_hash):
+async def login(payload: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(select(models.User).where(models.User.email == payload.email))).scalar_one_or_none()
+    if not user or not user.password_hash or not await _verify(payload.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Credenciais inválidas")
-    token = create_access_token(str(user.id))
+    user_id = user.id  # rollback abaixo expira o objeto (sem lazy load em sessão async)
+
+    # Custo do bcrypt mudou (BCRYPT_ROUNDS): regrava o hash com a senha que acabou de ser validada
+    # Melhor esforço: pool ocupado ou erro no banco não impedem o login (tenta de novo no próximo)
+    if password_needs_rehash(user.password_hash):
+        try:
+            user.password_hash = await hash_password_async(payload.password)
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.warning("Rehash da senha adiado para o usuário %s: %s", user_id, e)
+
+    token = create_access_token(str(user_id))
     return {"access_token": token}
 
 
 @router.post("/forgot-password", summary="Solicitar reset de senha (sempre 200)")
-async def forgot_password(payload: ForgotPasswordIn, background: BackgroundTasks, db: Session = Depends(get_db)):
+async def forgot_password(payload: ForgotPasswordIn, db: AsyncSession = Depends(get_async_db)):
     """
     Idempotente: sempre retorna 200.
     Em DEBUG, devolve debug_reset_link e não deixa a exceção do SMTP virar 500.
     """
-    user = db.query(User).filter(User.email == payload.email).first()
+    user = (await db.execute(select(User).where(User.email == payload.email))).scalar_one_or_none()
     if user:
-        raw_token = secrets.token_urlsafe(32)
-        token_hash = sha256_hex(raw_token)
-        expires_at = datetime.now(timezone.utc) + timedelta(minutes=RESET_TOKEN_TTL_MIN)
+        expires_at = datetime.now(timezone.utc) + timedelta(minutes=reset_mail.RESET_TOKEN_TTL_MIN)
 
-        pr = PasswordReset(user_id=user.id, token_hash=token_hash, expires_at=expires_at)
-        db.add(pr)
-        db.commit()
+        # Limita tokens válidos por usuário: os mais antigos além do limite são invalidados
+        now = datetime.now(timezone.utc)
+        oldest = (
+            select(PasswordReset.id)
+            .where(
+                PasswordReset.user_id == user.id,
+                PasswordReset.used_at.is_(None),
+                PasswordReset.expires_at > now,
+            )
+            .order_by(PasswordReset.id.desc())
+            .offset(max(0, settings.RESET_TOKEN_MAX_OUTSTANDING - 1))
+        )
+        await db.execute(
+            update(PasswordReset)
+            .where(PasswordReset.id.in_(oldest.scalar_subquery()))
+            .values(used_at=now)
+            .execution_options(synchronize_session=False)
+        )
 
-        link = f"{FRONTEND_RESET_URL}?token={raw_token}"
-        html = f"""
-        <p>Olá{f", {user.name}" if getattr(user, 'name', None) else ''}!</p>
-        <p>Use o link abaixo para redefinir sua senha (válido por {RESET_TOKEN_TTL_MIN} minutos):</p>
-        <p><a href="{link}">Redefinir senha</a></p>
-        <p>Se você não solicitou, ignore este e-mail.</p>
-        """
+        # Token derivado do id do pedido: o banco guarda só o hash; o dispatcher refaz o mesmo token
+        pr = PasswordReset(user_id=user.id, token_hash="", expires_at=expires_at)
+        db.add(pr)
+        await db.flush()
+        raw_token = reset_mail.reset_token(pr.id, expires_at)
+        pr.token_hash = sha256_hex(raw_token)
 
-        # --- DEBUG: retorna link e captura erro de e-mail sem 500 ---
+        # --- DEBUG: devolve o link; envio síncrono só com DEBUG_SYNC_EMAIL (erro de e-mail não vira 500) ---
         if DEBUG_RETURN_RESET_LINK:
-            if DEBUG_SYNC_EMAIL:
-                try:
-                    await send_email(to=user.email, subject="Redefinição de senha", html=html)
-                    return {"debug_reset_link": link, "email_status": "sent"}
-                except Exception as e:
-                    return {"debug_reset_link": link, "email_status": "error", "email_error": str(e)}
-            else:
-                background.add_task(send_email, to=user.email, subject="Redefinição de senha", html=html)
-                return {"debug_reset_link": link, "email_status": "queued"}
-
-        # --- PRODUÇÃO: envio em background ---
-        background.add_task(send_email, to=user.email, subject="Redefinição de senha", html=html)
+            await db.commit()
+            link = reset_mail.reset_link(raw_token)
+            if not DEBUG_SYNC_EMAIL:
+                return {"debug_reset_link": link, "email_status": "skipped"}
+            try:
+                await send_email(to=user.email, subject=reset_mail.SUBJECT, html=reset_mail.reset_html(user.name, link))
+                return {"debug_reset_link": link, "email_status": "sent"}
+            except Exception as e:
+                return {"debug_reset_link": link, "email_status": "error", "email_error": str(e)}
+
+        # Pedido e e-mail gravados na mesma transação: o envio sobrevive a restart do worker
+        # A fila guarda só a referência ao pedido; o HTML com o link é montado pelo dispatcher
+        await enqueue_mail(db, to=user.email, subject=reset_mail.SUBJECT, html=None,
+                           kind=reset_mail.KIND, ref_id=pr.id)
+        await db.commit()
+        kick_dispatch()
 
     return {"message": "Se o e-mail existir, enviaremos um link de redefinição."}
 
 
 @router.post("/reset-password", summary="Aplicar nova senha a partir do token")
-async def reset_password(payload: ResetPasswordIn, db: Session = Depends(get_db)):
+async def reset_password(payload: ResetPasswordIn, db: AsyncSession = Depends(get_async_db)):
     try:
         now = datetime.now(timezone.utc)
 
@@ -118,34 +166,39 @@ async def reset_password(payload: ResetPasswordIn, db: Session = Depends(get_db)
         token_hash = sha256_hex(token_plain)
 
         pr = (
-            db.query(PasswordReset)
-            .filter(PasswordReset.token_hash == token_hash)
-            .filter(PasswordReset.used_at.is_(None))
-            .filter(PasswordReset.expires_at > now)
-            .first()
-        )
+            await db.execute(
+                select(PasswordReset)
+                .where(PasswordReset.token_hash == token_hash)
+                .where(PasswordReset.used_at.is_(None))
+                .where(PasswordReset.expires_at > now)
+            )
+        ).scalars().first()
         if not pr:
             raise HTTPException(status_code=400, detail="Token inválido ou expirado")
 
-        user = db.query(User).filter(User.id == pr.user_id).first()
+        user = await db.get(User, pr.user_id)
         if not user:
             raise HTTPException(status_code=400, detail="Usuário não encontrado")
 
         # aplica nova senha (hash já blindado contra >72B)
-        user.password_hash = hash_password(payload.new_password)
+        user.password_hash = await _hash(payload.new_password)
         pr.used_at = now
 
         # invalida outros tokens pendentes
-        db.query(PasswordReset).filter(
-            PasswordReset.user_id == user.id,
-            PasswordReset.used_at.is_(None),
-            PasswordReset.id != pr.id,
-        ).update(
-            {PasswordReset.used_at: now},
-            synchronize_session=False,   # evita erro no SQLAlchemy 2.0
+        await db.execute(
+            update(PasswordReset)
+            .where(
+                PasswordReset.user_id == user.id,
+                PasswordReset.used_at.is_(None),
+                PasswordReset.id != pr.id,
+            )
+            .values(used_at=now)
+            .execution_options(synchronize_session=False)   # evita erro no SQLAlchemy 2.0
         )
 
-        db.commit()
+        await db.commit()
+        # Principal em cache pode estar desatualizado: força nova leitura
+        await principal_cache.invalidate(user.id)
         return {"message": "Senha redefinida com sucesso"}
 
     except HTTPException:
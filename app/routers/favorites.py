@@ -1,12 +1,21 @@
-# Rotas de favoritos: listar, adicionar e remover
+# Rotas de favoritos: listar, adicionar e remover (uma a uma ou em lote)
 
-from typing import List  
-from fastapi import APIRouter, Depends, HTTPException, status  
-from sqlalchemy.orm import Session  
+from datetime import datetime, timedelta, timezone
+from typing import List, Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import delete, literal, select, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.core.principal_cache import Principal
 from app.core.rate_limit import rate_limiter  
-from app.db.database import get_db 
+from app.db.database import get_async_db
 from app.db import models  
-from app.db.schemas import FavoriteIn, FavoriteOut 
+from app.db.schemas import FavoriteIn, FavoriteOut, FavoritesBulkIn, FavoritesBulkOut, FavoriteWithPriceOut
+from app.services.analytics import compute_analytics, load_series, resolve_ids
+from app.services.coingecko import fetch_coins_batch
+from app.services.price_history import read_closes
 from app.utils.deps import get_current_user  
 
 # Agrupa as rotas sob /favorites 
@@ -19,17 +28,91 @@ router = APIRouter(prefix="/favorites", tags=["favorites"])
     dependencies=[Depends(rate_limiter())],  
 )
 # Lista os favoritos do usuário logado
-def list_favorites(
-    db: Session = Depends(get_db),  
-    user: models.User = Depends(get_current_user),  
+async def list_favorites(
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(get_current_user),  
 ):
     # Filtra por usuário e ordena do mais recente para o mais antigo
-    return (
-        db.query(models.Favorite)
-        .filter(models.Favorite.user_id == user.id)
+    result = await db.execute(
+        select(models.Favorite)
+        .where(models.Favorite.user_id == user.id)
         .order_by(models.Favorite.id.desc())
-        .all()
     )
+    return result.scalars().all()
+
+# Favoritos já com preço: uma consulta no banco + uma busca em lote no CoinGecko/snapshot
+@router.get(
+    "/with-prices",
+    response_model=List[FavoriteWithPriceOut],
+    dependencies=[Depends(rate_limiter())],
+)
+async def list_favorites_with_prices(
+    vs_currency: str = Query("brl"),
+    sort: Literal["added", "change_desc", "change_asc"] = Query("added"),
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(get_current_user),
+):
+    rows = (
+        await db.execute(
+            select(models.Favorite.coin_id, models.Favorite.added_at)
+            .where(models.Favorite.user_id == user.id)
+            .order_by(models.Favorite.added_at.desc())
+        )
+    ).all()
+    # Fecha a transação antes da chamada de rede: a conexão volta ao pool
+    await db.commit()
+    if not rows:
+        return []
+
+    batch = await fetch_coins_batch([coin_id for coin_id, _ in rows], vs_currency=vs_currency)
+    by_id = {c["id"]: c for c in batch["coins"]}
+    by_symbol = {(c.get("symbol") or "").lower(): c for c in batch["coins"]}
+    out = [
+        {"coin_id": coin_id, "added_at": added_at, "market": by_id.get(coin_id) or by_symbol.get(coin_id.lower())}
+        for coin_id, added_at in rows
+    ]
+
+    if sort != "added":
+        # Sem cotação vai para o fim em qualquer direção
+        def change(item):
+            return (item["market"] or {}).get("price_change_percentage_24h")
+        with_value = [i for i in out if change(i) is not None]
+        without = [i for i in out if change(i) is None]
+        with_value.sort(key=change, reverse=(sort == "change_desc"))
+        out = with_value + without
+    return out
+
+# Retornos, volatilidade, drawdown e correlação das moedas favoritas (NumPy, em lote)
+@router.get(
+    "/analytics",
+    dependencies=[Depends(rate_limiter())],
+)
+async def favorites_analytics(
+    vs_currency: str = Query("usd"),
+    days: int = Query(30, ge=7, le=365),
+    rolling: int = Query(7, ge=1, le=90),
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(get_current_user),
+):
+    coin_ids = list(
+        (await db.execute(select(models.Favorite.coin_id).where(models.Favorite.user_id == user.id))).scalars()
+    )
+    ids = resolve_ids(coin_ids)
+    start = datetime.now(timezone.utc) - timedelta(days=days)
+    local = await read_closes(db, sorted(set(ids.values())), vs_currency, "1d", start) if ids else {}
+    await db.commit()  # nada de conexão parada em transação enquanto busca no CoinGecko
+    series, throttled = await load_series(local, ids, vs_currency, days)
+    # Cálculo em thread: não segura o event loop em carteiras grandes
+    result = await run_in_threadpool(compute_analytics, series, rolling)
+    result.update({
+        "vs_currency": vs_currency.lower(),
+        "days": days,
+        "rolling": rolling,
+        "missing": [c for c in coin_ids if c not in series and c not in throttled],
+        "throttled": throttled,
+    })
+    return result
+
 # Avisa se foi criado
 @router.post(
     "/",
@@ -38,33 +121,27 @@ def list_favorites(
     dependencies=[Depends(rate_limiter())],  
 )
 # Adiciona uma moeda aos favoritos do usuário
-def add_favorite(
+async def add_favorite(
     body: FavoriteIn, 
-    db: Session = Depends(get_db),
-    user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(get_current_user),
 ):
-    # Impede duplicidade 
-    exists = (
-        db.query(models.Favorite)
-        .filter(
-            models.Favorite.user_id == user.id,
-            models.Favorite.coin_id == body.coin_id,
-        )
-        .first()
+    # Um único INSERT: a constraint uq_user_coin impede duplicidade (sem SELECT antes, sem corrida)
+    stmt = (
+        pg_insert(models.Favorite)
+        .values(user_id=user.id, coin_id=body.coin_id)
+        .on_conflict_do_nothing(constraint="uq_user_coin")
+        .returning(models.Favorite.id, models.Favorite.coin_id, models.Favorite.user_id)
     )
-    if exists:
+    row = (await db.execute(stmt)).first()
+    await db.commit()
+    if row is None:
         # Retorna 409: conflito (já existe)
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="Moeda já está nos favoritos",
         )
-
-    # Cria, persiste e retorna o favorito
-    fav = models.Favorite(user_id=user.id, coin_id=body.coin_id)
-    db.add(fav)
-    db.commit()
-    db.refresh(fav)
-    return fav
+    return {"id": row.id, "coin_id": row.coin_id, "user_id": row.user_id}
 
 @router.delete(
     "/{coin_id}",
@@ -72,28 +149,126 @@ def add_favorite(
     dependencies=[Depends(rate_limiter())],  
 )
 # Remove a moeda {coin_id} dos favoritos do usuário
-def remove_favorite(
+async def remove_favorite(
     coin_id: str,  
-    db: Session = Depends(get_db),
-    user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(get_current_user),
 ):
-    # Busca o favorito do usuário para o coin_id informado
-    fav = (
-        db.query(models.Favorite)
-        .filter(
+    # DELETE ... RETURNING: remove e informa se existia em um único comando
+    stmt = (
+        delete(models.Favorite)
+        .where(
             models.Favorite.user_id == user.id,
             models.Favorite.coin_id == coin_id,
         )
-        .first()
+        .returning(models.Favorite.id)
     )
-    if not fav:
+    deleted = (await db.execute(stmt)).first()
+    await db.commit()
+    if deleted is None:
         # 404: se não for encontrado
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Não encontrado",
         )
-
-    # Exclui e confirma no banco
-    db.delete(fav)
-    db.commit()
     return None  # 204 No Content
+
+
+# Lote: ids sem repetição, na ordem enviada (lista vazia só é aceita no replace)
+def _bulk_ids(body: FavoritesBulkIn, allow_empty: bool = False) -> List[str]:
+    ids = list(dict.fromkeys(c.strip() for c in body.coin_ids if c and c.strip()))
+    if not ids and not allow_empty:
+        raise HTTPException(status_code=400, detail="Informe ao menos um coin_id")
+    if len(ids) > settings.FAVORITES_BULK_MAX:
+        raise HTTPException(status_code=400, detail=f"Máximo de {settings.FAVORITES_BULK_MAX} moedas por requisição")
+    return ids
+
+# Adiciona várias moedas: um INSERT ... ON CONFLICT DO NOTHING RETURNING e um commit
+@router.post(
+    "/bulk",
+    response_model=FavoritesBulkOut,
+    dependencies=[Depends(rate_limiter())],
+)
+async def add_favorites_bulk(
+    body: FavoritesBulkIn,
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(get_current_user),
+):
+    ids = _bulk_ids(body)
+    stmt = (
+        pg_insert(models.Favorite)
+        .values([{"user_id": user.id, "coin_id": c} for c in ids])
+        .on_conflict_do_nothing(constraint="uq_user_coin")
+        .returning(models.Favorite.coin_id)
+    )
+    added = set((await db.execute(stmt)).scalars())
+    await db.commit()
+    return {
+        "results": [{"coin_id": c, "status": "added" if c in added else "exists"} for c in ids],
+        "added": len(added),
+    }
+
+# Remove várias moedas: um DELETE ... RETURNING e um commit
+@router.post(
+    "/bulk/remove",
+    response_model=FavoritesBulkOut,
+    dependencies=[Depends(rate_limiter())],
+)
+async def remove_favorites_bulk(
+    body: FavoritesBulkIn,
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(get_current_user),
+):
+    ids = _bulk_ids(body)
+    stmt = (
+        delete(models.Favorite)
+        .where(models.Favorite.user_id == user.id, models.Favorite.coin_id.in_(ids))
+        .returning(models.Favorite.coin_id)
+    )
+    removed = set((await db.execute(stmt)).scalars())
+    await db.commit()
+    return {
+        "results": [{"coin_id": c, "status": "removed" if c in removed else "not_found"} for c in ids],
+        "removed": len(removed),
+    }
+
+# Substitui o conjunto inteiro de favoritos de forma atômica
+# DELETE e INSERT vão juntos numa única instrução (CTEs com RETURNING), numa transação
+@router.put(
+    "/",
+    response_model=FavoritesBulkOut,
+    dependencies=[Depends(rate_limiter())],
+)
+async def replace_favorites(
+    body: FavoritesBulkIn,
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(get_current_user),
+):
+    ids = _bulk_ids(body, allow_empty=True)
+    removed_cte = (
+        delete(models.Favorite)
+        .where(models.Favorite.user_id == user.id, models.Favorite.coin_id.not_in(ids))
+        .returning(models.Favorite.coin_id)
+        .cte("removed")
+    )
+    parts = [select(removed_cte.c.coin_id, literal("removed").label("status"))]
+    if ids:
+        added_cte = (
+            pg_insert(models.Favorite)
+            .values([{"user_id": user.id, "coin_id": c} for c in ids])
+            .on_conflict_do_nothing(constraint="uq_user_coin")
+            .returning(models.Favorite.coin_id)
+            .cte("added")
+        )
+        parts.append(select(added_cte.c.coin_id, literal("added").label("status")))
+    rows = (await db.execute(union_all(*parts) if len(parts) > 1 else parts[0])).all()
+    await db.commit()
+
+    changed = {coin_id: st for coin_id, st in rows}
+    results = [{"coin_id": c, "status": changed.get(c, "kept")} for c in ids]
+    results += [{"coin_id": c, "status": "removed"} for c, st in changed.items() if st == "removed"]
+    return {
+        "results": results,
+        "added": sum(1 for st in changed.values() if st == "added"),
+        "removed": sum(1 for st in changed.values() if st == "removed"),
+    }
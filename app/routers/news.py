@@ -1,14 +1,50 @@
-# Notícias via NewsAPI. Público, mas com rate limit.
+# Notícias do acervo local (alimentado pela NewsAPI em segundo plano). Público, mas com rate limit.
 
-from fastapi import APIRouter, Depends
-from typing import List
-from app.services.news_service import fetch_news
+from datetime import datetime, timezone
+from typing import AsyncGenerator, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import AsyncSessionLocal
 from app.db.schemas import NewsItem
+from app.core.config import settings
+from app.core.http_cache import cached_json_response
 from app.core.rate_limit import rate_limiter
+from app.services.news_store import InvalidCursor, list_news as list_stored_news, news_store
 
 router = APIRouter(prefix="/news", tags=["news"])
 
-# Obtém uma lista de notícias recentes (títulos e links)
+# Sessão só quando há banco (sem DATABASE_URL o acervo fica em memória)
+async def _optional_db() -> AsyncGenerator[Optional[AsyncSession], None]:
+    if AsyncSessionLocal is None:
+        yield None
+        return
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Lista notícias (mais recentes primeiro); próxima página no header X-Next-Cursor
 @router.get("/", response_model=List[NewsItem], dependencies=[Depends(rate_limiter())])
-async def list_news():
-    return await fetch_news()
+async def list_news(
+    request: Request,
+    language: Optional[str] = Query(None, description="Padrão: NEWS_LANGUAGE"),
+    since: Optional[datetime] = Query(None, description="Só notícias publicadas a partir desta data"),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=settings.NEWS_PAGE_MAX),
+    db: Optional[AsyncSession] = Depends(_optional_db),
+):
+    lang = (language or settings.NEWS_LANGUAGE or "pt").lower()
+    if since is not None and since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    try:
+        items, next_cursor = await list_stored_news(db, lang, since, cursor, limit)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    # ETag pelo conteúdo: cliente que já tem a lista recebe 304 sem corpo
+    # Corpo/ETag memorizados por página até o acervo mudar (news_store.version)
+    return cached_json_response(
+        request,
+        items,
+        max_age=settings.NEWS_MAX_AGE,
+        memo_key=("news", lang, since, cursor, limit),
+        version=news_store.version,
+        headers={"X-Next-Cursor": next_cursor} if next_cursor else None,
+    )
@@ -1,9 +1,15 @@
 # Rota do MailerLite(Newsletter)
-from fastapi import APIRouter, HTTPException
+# A inscrição é gravada no banco e sincronizada com a MailerLite em segundo plano (outbox)
+import html
+from urllib.parse import urlencode
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import HTMLResponse
 from pydantic import BaseModel, EmailStr
-import httpx  # para tipar/pegar erros de rede
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.services.mailerlite import subscribe as ml_subscribe
+from app.core.security import verify_unsubscribe_token
+from app.db.database import get_async_db
+from app.services.newsletter_outbox import enqueue, unsubscribe
 
 router = APIRouter(prefix="/api/newsletter", tags=["newsletter"])
 
@@ -12,21 +18,32 @@ class SubscribeIn(BaseModel):
     email: EmailStr
     name: str | None = None
 
-#Inscreve o usuário na MailerLite
-@router.post("/subscribe")
-async def subscribe(body: SubscribeIn):
-    try:
-        result = await ml_subscribe(email=body.email, name=body.name)
-        return {"message": "ok", "provider": "mailerlite", "result": result}
-
-    except RuntimeError as e:
-        # Erros conhecidos (chave ausente, 401, 429, já inscrito, etc.)
-        raise HTTPException(status_code=400, detail=str(e))
-
-    except httpx.HTTPError as e:
-        # Qualquer erro HTTP não coberto acima
-        raise HTTPException(status_code=502, detail=f"Erro HTTP com MailerLite: {e!s}")
-
-    except Exception as e:
-        # Fallback: nada de 500 misterioso; devolve detalhe
-        raise HTTPException(status_code=502, detail=f"Falha ao inscrever na MailerLite: {e!s}")
+#Inscreve o usuário na newsletter (a MailerLite recebe pelo worker do scheduler)
+@router.post("/subscribe", status_code=status.HTTP_202_ACCEPTED)
+async def subscribe(body: SubscribeIn, db: AsyncSession = Depends(get_async_db)):
+    result = await enqueue(db, email=body.email, name=body.name)
+    return {"message": "accepted", "provider": "mailerlite", "status": result}
+
+# Descadastro pelo link do digest (token HMAC do e-mail, com validade; sem login)
+# GET só mostra a confirmação: leitores de link (Safe Links, proxies de imagem) não descadastram ninguém
+@router.get("/unsubscribe", response_class=HTMLResponse)
+async def unsubscribe_confirm(email: EmailStr = Query(...), token: str = Query(...)):
+    if not verify_unsubscribe_token(email, token):
+        raise HTTPException(status_code=400, detail="Link de descadastro inválido ou expirado")
+    action = "?" + urlencode({"email": email, "token": token})
+    return f"""
+    <p>Cancelar o envio da newsletter para {html.escape(email)}?</p>
+    <form method="post" action="{html.escape(action)}"><button type="submit">Cancelar inscrição</button></form>
+    """
+
+# POST do botão acima e do one-click dos clientes de e-mail (RFC 8058: corpo "List-Unsubscribe=One-Click")
+@router.post("/unsubscribe")
+async def unsubscribe_newsletter(
+    email: EmailStr = Query(...),
+    token: str = Query(...),
+    db: AsyncSession = Depends(get_async_db),
+):
+    if not verify_unsubscribe_token(email, token):
+        raise HTTPException(status_code=400, detail="Link de descadastro inválido ou expirado")
+    await unsubscribe(db, email)
+    return {"message": "unsubscribed"}
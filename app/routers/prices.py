@@ -1,7 +1,18 @@
 # Rotas de validação/parâmetros do CoinGecko 
 
-from fastapi import APIRouter, Query
-from app.services.coingecko import fetch_markets, fetch_coin_detail, search_coins
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import FrozenSet, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.database import get_async_db
+from app.services.coin_index import coin_index
+from app.services.price_history import read_history
+from app.core.http_cache import cached_json_response
+from app.services.coingecko import fetch_markets_with_meta, fetch_coin_detail_with_meta, fetch_coins_batch, search_coins
+from app.services.price_stream import price_broadcaster
 
 #Cria a rota
 router = APIRouter(prefix="/api/prices", tags=["prices"])
@@ -9,18 +20,146 @@ router = APIRouter(prefix="/api/prices", tags=["prices"])
 # Config de tipo de moeda, quantidade de itens por pagina e numero de pagina
 @router.get("/markets")
 async def markets(
+    request: Request,
     vs_currency: str = Query("brl"),
     per_page: int = Query(10, ge=1, le=250),
     page: int = Query(1, ge=1),
 ):
-    return await fetch_markets(vs_currency=vs_currency, per_page=per_page, page=page)
+    raw, meta = await fetch_markets_with_meta(vs_currency=vs_currency, per_page=per_page, page=page)
+    # Frescor do dado nos headers (o corpo continua sendo a lista do CoinGecko, sem re-serializar)
+    return cached_json_response(
+        request,
+        raw,
+        max_age=meta["ttl"] - meta["age"],
+        memo_key=("markets", vs_currency.lower(), per_page, page),
+        version=meta["version"],
+        headers={
+            "X-Data-Source": meta["source"],
+            "X-Data-Age": str(int(meta["age"])),
+            "X-Data-Fetched-At": str(int(meta["fetched_at"])),
+        },
+    )
+
+# Valida a moeda de cotação (só as que têm snapshot em background) e o filtro de moedas
+def _stream_params(vs_currency: str, ids: Optional[str]) -> tuple[str, Optional[FrozenSet[str]]]:
+    cur = vs_currency.lower()
+    if cur not in settings.MARKET_SNAPSHOT_CURRENCIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"vs_currency sem streaming. Use: {', '.join(settings.MARKET_SNAPSHOT_CURRENCIES)}",
+        )
+    coins = frozenset(c.strip().lower() for c in ids.split(",") if c.strip()) if ids else None
+    return cur, coins or None
+
+# Preços ao vivo via Server-Sent Events: 1º evento = estado completo, depois só o que mudou
+@router.get("/stream")
+async def stream(
+    request: Request,
+    vs_currency: str = Query("brl"),
+    ids: Optional[str] = Query(None, description="Lista de coin ids separados por vírgula"),
+):
+    cur, coins = _stream_params(vs_currency, ids)
+    sub = price_broadcaster.subscribe(cur, coins)
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    payload = await asyncio.wait_for(sub.queue.get(), settings.PRICE_STREAM_HEARTBEAT_SEC)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"  # mantém proxies/conexão vivos
+                    continue
+                yield b"event: prices\ndata: " + payload + b"\n\n"
+        finally:
+            price_broadcaster.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Mesmo fluxo do /stream, via WebSocket
+@router.websocket("/ws")
+async def stream_ws(
+    websocket: WebSocket,
+    vs_currency: str = Query("brl"),
+    ids: Optional[str] = Query(None),
+):
+    try:
+        cur, coins = _stream_params(vs_currency, ids)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=str(e.detail))
+        return
+    await websocket.accept()
+    sub = price_broadcaster.subscribe(cur, coins)
+    try:
+        while True:
+            try:
+                payload = await asyncio.wait_for(sub.queue.get(), settings.PRICE_STREAM_HEARTBEAT_SEC)
+            except asyncio.TimeoutError:
+                await websocket.send_text('{"type":"ping"}')
+                continue
+            await websocket.send_text(payload.decode("utf-8"))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        price_broadcaster.unsubscribe(sub)
 
 # Busca moedas pelo termo informado como nome, símbolo, slug e etc
 @router.get("/coins/search")
 async def coins_search(q: str = Query(..., min_length=1)):
     return await search_coins(q=q)
 
+# Várias moedas em uma requisição (ex.: watchlist): /coins?ids=bitcoin,eth,sol
+@router.get("/coins")
+async def coins_batch(
+    ids: str = Query(..., min_length=1, description="Coin ids ou símbolos separados por vírgula"),
+    vs_currency: str = Query("brl"),
+):
+    wanted = list(dict.fromkeys(i.strip().lower() for i in ids.split(",") if i.strip()))
+    if not wanted:
+        raise HTTPException(status_code=400, detail="Informe ao menos um id")
+    if len(wanted) > settings.BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Máximo de {settings.BATCH_MAX_IDS} ids por requisição")
+    return await fetch_coins_batch(wanted, vs_currency=vs_currency)
+
 # Obtém dados completos de uma moeda específica, identificada por coin_id.
 @router.get("/coins/{coin_id}")
-async def coin_detail(coin_id: str):
-    return await fetch_coin_detail(coin_id=coin_id)
+async def coin_detail(coin_id: str, request: Request):
+    raw, meta = await fetch_coin_detail_with_meta(coin_id=coin_id)
+    # Bytes do CoinGecko repassados sem parse/dump
+    return cached_json_response(
+        request,
+        raw,
+        max_age=meta["ttl"] - meta["age"],
+        memo_key=("coin", meta["id"]),
+    )
+
+# Janela padrão de cada intervalo quando start não é informado
+_HISTORY_DEFAULT_WINDOW = {"1m": timedelta(days=1), "1h": timedelta(days=7), "1d": timedelta(days=365)}
+
+# Histórico OHLC local (sem chamar o CoinGecko)
+@router.get("/history/{coin_id}")
+async def history(
+    coin_id: str,
+    vs_currency: str = Query("brl"),
+    interval: Literal["1m", "1h", "1d"] = Query("1h"),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # Datas sem fuso são tratadas como UTC
+    end = end or datetime.now(timezone.utc)
+    end = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+    start = start or end - _HISTORY_DEFAULT_WINDOW[interval]
+    start = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start deve ser anterior a end")
+    real_id = coin_index.resolve(coin_id) or coin_id
+    return {
+        "coin_id": real_id,
+        "vs_currency": vs_currency.lower(),
+        "interval": interval,
+        "candles": await read_history(db, real_id, vs_currency, interval, start, end),
+    }
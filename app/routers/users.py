@@ -1,15 +1,91 @@
-from typing import List
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+import base64
+import binascii
+import csv
+import io
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.database import get_db
+from app.core.config import settings
+from app.core.fastjson import dumps
+from app.db.database import AsyncSessionLocal, get_async_db
 from app.db.models import User
 from app.db.schemas import UserListItem
+from app.utils.deps import get_admin_user
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
+# Cursor opaco: e-mail do último item da página (coluna única e indexada)
+def _encode_cursor(email: str) -> str:
+    return base64.urlsafe_b64encode(email.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
 @router.get("", response_model=List[UserListItem], summary="Listar usuários (name, email)")
-def list_users(db: Session = Depends(get_db)):
-    # consulta só as colunas necessárias
-    rows = db.query(User.name, User.email).all()
+async def list_users(
+    response: Response,
+    limit: int = Query(100, ge=1, le=settings.USERS_PAGE_MAX),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor da página anterior"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # Paginação por keyset em users.email: custo constante por página, sem OFFSET
+    stmt = select(User.name, User.email).order_by(User.email).limit(limit + 1)
+    if cursor:
+        stmt = stmt.where(User.email > _decode_cursor(cursor))
+    rows = (await db.execute(stmt)).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1][1])
     return [UserListItem(name=n, email=e) for (n, e) in rows]
+
+# Dump com e-mails de todos os usuários: só administradores (ADMIN_EMAILS)
+@router.get(
+    "/export",
+    summary="Exportar usuários (NDJSON ou CSV, em streaming)",
+    dependencies=[Depends(get_admin_user)],
+)
+async def export_users(format: Literal["ndjson", "csv"] = Query("ndjson")):
+    if AsyncSessionLocal is None:
+        raise HTTPException(status_code=503, detail="Banco de dados não configurado")
+
+    async def rows():
+        # Sessão própria: a do Depends fecharia antes do fim do streaming
+        # Cursor do lado do servidor, lido em lotes (memória constante)
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(
+                select(User.name, User.email)
+                .order_by(User.email)
+                .execution_options(yield_per=settings.USERS_EXPORT_BATCH)
+            )
+            async for part in result.partitions():
+                yield part
+
+    async def ndjson():
+        async for part in rows():
+            yield b"".join(dumps({"name": n, "email": e}) + b"\n" for n, e in part)
+
+    async def as_csv():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(["name", "email"])
+        async for part in rows():
+            writer.writerows(part)
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():
+            yield buf.getvalue().encode("utf-8")
+
+    if format == "csv":
+        return StreamingResponse(
+            as_csv(),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="users.csv"'},
+        )
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
@@ -0,0 +1,145 @@
+# Analytics de carteira (favoritos) com NumPy
+# - Alinha as séries diárias de todas as moedas numa matriz (moedas x dias)
+# - Retornos, volatilidade, drawdown e correlação calculados em lote, sem loops por moeda
+
+from __future__ import annotations
+import asyncio
+import math
+import warnings
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from fastapi import HTTPException
+from app.core.config import settings
+from app.services.coin_index import coin_index
+from app.services.coingecko import cached_price_series, fetch_price_series
+
+DAY = 86400
+MIN_CORR_DAYS = 3  # mínimo de dias em comum para a correlação de um par
+Series = List[Tuple[float, float]]
+
+
+def _num(x: float) -> float | None:
+    # NaN/inf não são JSON válido
+    return None if x is None or not math.isfinite(x) else float(x)
+
+
+def _align(series: Dict[str, Series]) -> Tuple[List[str], np.ndarray]:
+    # Matriz de preços (moedas x dias), último valor do dia, com forward-fill
+    ids = [cid for cid, pts in series.items() if len(pts) >= 2]
+    if not ids:
+        return [], np.empty((0, 0))
+    arrays = [np.asarray(series[cid], dtype=float) for cid in ids]
+    days = np.unique(np.concatenate([(a[:, 0] // DAY).astype(np.int64) for a in arrays]))
+    prices = np.full((len(ids), len(days)), np.nan)
+    for row, a in enumerate(arrays):
+        cols = np.searchsorted(days, (a[:, 0] // DAY).astype(np.int64))
+        prices[row, cols] = a[:, 1]
+    mask = np.isnan(prices)
+    idx = np.where(~mask, np.arange(prices.shape[1]), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    prices = prices[np.arange(prices.shape[0])[:, None], idx]
+    return ids, prices
+
+
+# Correlação par a par, cada par só nos dias em que as duas moedas têm retorno
+# (moeda recém-listada não zera a matriz inteira); poucos dias em comum -> NaN
+def _pairwise_corr(returns: np.ndarray) -> np.ndarray:
+    valid = (~np.isnan(returns)).astype(float)
+    x = np.where(valid > 0, returns, 0.0)
+    n = valid @ valid.T                 # dias em comum
+    sx = x @ valid.T                    # soma de x_i nos dias em comum com j
+    sxx = (x * x) @ valid.T
+    cov = x @ x.T - sx * sx.T / n
+    var_i = sxx - sx * sx / n
+    corr = cov / np.sqrt(var_i * var_i.T)
+    corr[n < MIN_CORR_DAYS] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+def compute_analytics(series: Dict[str, Series], rolling: int) -> Dict[str, Any]:
+    ids, prices = _align(series)
+    if not ids:
+        return {"coins": [], "correlation": {"ids": [], "matrix": []}}
+
+    with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # fatias só com NaN viram None
+        returns = prices[:, 1:] / prices[:, :-1] - 1.0
+
+        # Primeiro preço válido de cada moeda
+        valid = ~np.isnan(prices)
+        first_idx = valid.argmax(axis=1)
+        first = prices[np.arange(len(ids)), first_idx]
+        last = prices[:, -1]
+        total_return = last / first - 1.0
+
+        k = min(rolling, prices.shape[1] - 1)
+        rolling_return = last / prices[:, -1 - k] - 1.0
+
+        volatility = np.nanstd(returns, axis=1, ddof=1) * math.sqrt(365)
+
+        running_max = np.fmax.accumulate(prices, axis=1)
+        max_drawdown = np.nanmin(prices / running_max - 1.0, axis=1)
+
+        corr = _pairwise_corr(returns)
+
+    coins = [
+        {
+            "coin_id": cid,
+            "total_return": _num(total_return[i]),
+            "rolling_return": _num(rolling_return[i]),
+            "volatility": _num(volatility[i]),
+            "max_drawdown": _num(max_drawdown[i]),
+        }
+        for i, cid in enumerate(ids)
+    ]
+    matrix = [[_num(v) for v in row] for row in np.atleast_2d(corr)]
+    return {"coins": coins, "correlation": {"ids": ids, "matrix": matrix}}
+
+
+# Favorito -> id do CoinGecko (símbolo/maiúsculas viram o id canônico); sem índice carregado, fica como está
+def resolve_ids(coin_ids: List[str]) -> Dict[str, str]:
+    if not coin_index.ready:
+        return {cid: cid for cid in coin_ids}
+    return {cid: coin_index.resolve(cid) or cid for cid in coin_ids}
+
+
+# Séries de preço: histórico local (closes já lidos pelo chamador) e CoinGecko em cache para o que faltar
+# Não recebe a sessão: o chamador fecha a transação antes das chamadas de rede
+# Séries já em cache não contam; no máximo ANALYTICS_MAX_REMOTE_FETCHES buscas de verdade por chamada.
+# O excedente e as barradas pela cota voltam em throttled (não são "missing": só não deu para buscar agora);
+# como as buscadas ficam em cache, a próxima chamada avança para as seguintes
+
+async def load_series(
+    local: Dict[str, Series], ids: Dict[str, str], vs_currency: str, days: int
+) -> Tuple[Dict[str, Series], List[str]]:
+    series: Dict[str, Series] = {}
+    remote: List[str] = []
+    for fav, cid in ids.items():
+        pts = local.get(cid, [])
+        if len(pts) >= days * 0.8:
+            series[fav] = pts
+            continue
+        cached = cached_price_series(cid, vs_currency, days)
+        if cached is None:
+            remote.append(fav)
+        elif cached:
+            series[fav] = cached
+
+    cap = max(0, settings.ANALYTICS_MAX_REMOTE_FETCHES)
+    throttled = remote[cap:]
+    sem = asyncio.Semaphore(settings.ANALYTICS_FETCH_CONCURRENCY)
+
+    async def one(fav: str):
+        async with sem:
+            try:
+                return fav, await fetch_price_series(ids[fav], vs_currency, days)
+            except HTTPException as e:
+                # 503 = fila do governador cheia; 502 = 429 do CoinGecko
+                return fav, None if e.status_code in (502, 503) else []
+
+    for fav, pts in await asyncio.gather(*(one(f) for f in remote[:cap])):
+        if pts is None:
+            throttled.append(fav)
+        elif pts:
+            series[fav] = pts
+    return series, throttled
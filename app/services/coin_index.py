@@ -0,0 +1,109 @@
+# Índice local de moedas do CoinGecko (/coins/list)
+# - Resolve id/símbolo em O(1) (dicts) sem chamar a API
+# - Autocomplete por prefixo (arrays ordenados + bisect) e por substring no nome
+# - Atualizado periodicamente pelo APScheduler (app/tasks/scheduler.py)
+
+from __future__ import annotations
+import logging
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CoinIndex:
+    def __init__(self):
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.by_symbol: Dict[str, List[str]] = {}
+        self._terms: List[Tuple[str, str]] = []  # (termo minúsculo, id), ordenado
+        self._names: List[Tuple[str, str]] = []  # (nome minúsculo, id)
+        self.loaded_at: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    def _rank(self, coin_id: str) -> int:
+        rank = self.by_id.get(coin_id, {}).get("market_cap_rank")
+        return rank if isinstance(rank, int) else 1_000_000
+
+    def load(self, coins: List[Dict[str, Any]], markets: List[Dict[str, Any]] | None = None) -> None:
+        # coins: itens de /coins/list; markets: top de /coins/markets (rank e imagem)
+        extra = {m.get("id"): m for m in (markets or []) if m.get("id")}
+        by_id: Dict[str, Dict[str, Any]] = {}
+        for c in coins:
+            cid = (c.get("id") or "").strip()
+            if not cid:
+                continue
+            m = extra.get(cid, {})
+            image = m.get("image")
+            # Mesmo formato de um item de /search (símbolo em maiúsculas, api_symbol, thumb/large)
+            by_id[cid] = {
+                "id": cid,
+                "name": c.get("name") or "",
+                "api_symbol": cid,
+                "symbol": (c.get("symbol") or "").upper(),
+                "market_cap_rank": m.get("market_cap_rank"),
+                "thumb": image.replace("/large/", "/thumb/") if image else None,
+                "large": image,
+            }
+
+        by_symbol: Dict[str, List[str]] = {}
+        terms: List[Tuple[str, str]] = []
+        names: List[Tuple[str, str]] = []
+        for cid, c in by_id.items():
+            symbol = c["symbol"].lower()
+            if symbol:
+                by_symbol.setdefault(symbol, []).append(cid)
+                terms.append((symbol, cid))
+            name = c["name"].lower()
+            terms.append((cid, cid))
+            if name:
+                terms.append((name, cid))
+                names.append((name, cid))
+
+        # Troca atômica das estruturas (leitores nunca veem um índice pela metade)
+        self.by_id = by_id
+        for ids in by_symbol.values():
+            ids.sort(key=self._rank)
+        self.by_symbol = by_symbol
+        self._terms = sorted(set(terms))
+        self._names = names
+        self.loaded_at = time.time()
+        logger.info("Índice de moedas carregado: %d moedas", len(by_id))
+
+    def resolve(self, id_or_symbol: str) -> Optional[str]:
+        key = id_or_symbol.strip().lower()
+        if key in self.by_id:
+            return key
+        ids = self.by_symbol.get(key)
+        return ids[0] if ids else None
+
+    def search(self, q: str, limit: int = 25) -> List[Dict[str, Any]]:
+        q = q.strip().lower()
+        if not q:
+            return []
+        found: Dict[str, None] = {}
+
+        # 1) prefixo em símbolo, id e nome
+        i = bisect_left(self._terms, (q, ""))
+        while i < len(self._terms) and self._terms[i][0].startswith(q):
+            found[self._terms[i][1]] = None
+            i += 1
+
+        # 2) substring no nome (busca "fuzzy" simples)
+        if len(found) < limit:
+            for name, cid in self._names:
+                if q in name:
+                    found[cid] = None
+
+        # Símbolo exato primeiro, depois por market cap
+        ranked = sorted(found, key=lambda cid: (self.by_id[cid]["symbol"].lower() != q, self._rank(cid)))
+        return [self.by_id[cid] for cid in ranked[:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"coins": len(self.by_id), "symbols": len(self.by_symbol), "loaded_at": self.loaded_at}
+
+
+coin_index = CoinIndex()
@@ -1,33 +1,75 @@
 # API Coingecko
 
 from __future__ import annotations
+import asyncio
 import os
-from typing import Any, Dict, List
+import time
+from typing import Any, Dict, List, Optional
 import httpx
 from fastapi import HTTPException
+from app.core.cache import SWRCache
+from app.core.config import settings
+from app.core.fastjson import RawJSON, loads
+from app.core.governor import QuotaWaitExceeded, governed_request
+from app.core.http import get_client
+from app.core.singleflight import SingleFlight, make_key
+from app.services.coin_index import coin_index
+from app.services.market_snapshot import market_snapshots
+from app.services.price_stream import price_broadcaster
 
-PRO_BASE = "https://pro-api.coingecko.com/api/v3"
-PUB_BASE = "https://api.coingecko.com/api/v3"
+# Cache de mercados: chave (vs_currency, per_page, page)
+markets_cache = SWRCache(
+    max_entries=settings.MARKETS_CACHE_MAX_ENTRIES,
+    ttl=settings.MARKETS_CACHE_TTL,
+    stale_ttl=settings.MARKETS_CACHE_STALE_TTL,
+)
+
+# Detalhe de moeda (/coins/{id}): chave = id real
+coin_cache = SWRCache(
+    max_entries=settings.COIN_DETAIL_CACHE_MAX_ENTRIES,
+    ttl=settings.COIN_DETAIL_CACHE_TTL,
+    stale_ttl=settings.COIN_DETAIL_CACHE_TTL * 5,
+)
+
+# Séries de preço diárias (market_chart): chave (coin_id, vs_currency, days), compartilhada entre usuários
+series_cache = SWRCache(
+    max_entries=settings.SERIES_CACHE_MAX_ENTRIES,
+    ttl=settings.SERIES_CACHE_TTL,
+    stale_ttl=settings.SERIES_CACHE_TTL * 4,
+)
+
+# Chamadas idênticas em andamento compartilham a mesma resposta
+coingecko_flight = SingleFlight("coingecko")
 
 def _want_pro() -> bool:
     return os.getenv("COINGECKO_USE_PRO") == "1" and bool(os.getenv("COINGECKO_API_KEY"))
 
 async def _get(path: str, params: Dict[str, Any] | None = None) -> httpx.Response:
+    return await coingecko_flight.do(make_key(path, params), lambda: _get_upstream(path, params))
+
+async def _get_upstream(path: str, params: Dict[str, Any] | None = None) -> httpx.Response:
     use_pro = _want_pro()
     headers = {"x-cg-pro-api-key": os.getenv("COINGECKO_API_KEY")} if use_pro else {}
 
-    async with httpx.AsyncClient(base_url=(PRO_BASE if use_pro else PUB_BASE), timeout=20) as client:
-        r = await client.get(path, params=params, headers=headers)
+    try:
+        name = "coingecko_pro" if use_pro else "coingecko_pub"
+        client = get_client(name)
+        r = await governed_request(name, lambda: client.get(path, params=params, headers=headers))
 
-    # Fallback automático quando key DEMO é usada em PRO (erro 10011)
-    if r.status_code == 400 and use_pro:
-        try:
-            body = r.json()
-            if isinstance(body, dict) and body.get("status", {}).get("error_code") == 10011:
-                async with httpx.AsyncClient(base_url=PUB_BASE, timeout=20) as client:
-                    r = await client.get(path, params=params)
-        except Exception:
-            pass
+        # Fallback automático quando key DEMO é usada em PRO (erro 10011)
+        if r.status_code == 400 and use_pro:
+            try:
+                body = r.json()
+                if isinstance(body, dict) and body.get("status", {}).get("error_code") == 10011:
+                    pub = get_client("coingecko_pub")
+                    r = await governed_request("coingecko_pub", lambda: pub.get(path, params=params))
+            except QuotaWaitExceeded:
+                raise
+            except Exception:
+                pass
+    except QuotaWaitExceeded as e:
+        # Fila cheia: devolve 503 com Retry-After em vez de estourar a cota do CoinGecko
+        raise HTTPException(503, str(e), headers={"Retry-After": str(int(e.wait) + 1)})
 
     if r.status_code == 429:
         raise HTTPException(502, "CoinGecko rate limit (429). Tente novamente.")
@@ -42,6 +84,14 @@ async def _get(path: str, params: Dict[str, Any] | None = None) -> httpx.Respons
     return r
 
 async def _resolve_coin_id(input_id_or_symbol: str) -> str:
+    # Índice local carregado: resolve sem chamar a API (id desconhecido segue como veio)
+    if coin_index.ready:
+        return coin_index.resolve(input_id_or_symbol) or input_id_or_symbol
+    return await coingecko_flight.do(
+        ("resolve", input_id_or_symbol.lower()), lambda: _resolve_coin_id_upstream(input_id_or_symbol)
+    )
+
+async def _resolve_coin_id_upstream(input_id_or_symbol: str) -> str:
     # 1) tenta como id direto
     try:
         r = await _get(
@@ -72,8 +122,9 @@ async def _resolve_coin_id(input_id_or_symbol: str) -> str:
 
 # ---------------------- FUNÇÕES EXPOSTAS ----------------------
 
-async def fetch_markets(vs_currency: str, per_page: int, page: int) -> List[Dict[str, Any]]:
-    params = {
+# Mesmos parâmetros nas duas leituras: a chave do single-flight (make_key) coincide
+def _markets_params(vs_currency: str, per_page: int, page: int) -> Dict[str, Any]:
+    return {
         "vs_currency": vs_currency,
         "order": "market_cap_desc",
         "per_page": per_page,
@@ -81,10 +132,143 @@ async def fetch_markets(vs_currency: str, per_page: int, page: int) -> List[Dict
         "sparkline": "false",
         "price_change_percentage": "24h",
     }
+
+async def _fetch_markets_upstream(vs_currency: str, per_page: int, page: int) -> List[Dict[str, Any]]:
+    r = await _get("/coins/markets", _markets_params(vs_currency, per_page, page))
+    return loads(r.content)
+
+async def fetch_markets(vs_currency: str, per_page: int, page: int) -> List[Dict[str, Any]]:
+    raw, _ = await fetch_markets_with_meta(vs_currency, per_page, page)
+    return raw.data
+
+# Corpo de /coins/markets guardado como bytes (repassado ao cliente sem parse/dump)
+async def _fetch_markets_raw(vs_currency: str, per_page: int, page: int) -> RawJSON:
+    r = await _get("/coins/markets", _markets_params(vs_currency, per_page, page))
+    return RawJSON(r.content)
+
+# Igual a fetch_markets, mas devolve o JSON pronto e informa de onde veio o dado e sua idade (segundos)
+async def fetch_markets_with_meta(vs_currency: str, per_page: int, page: int) -> tuple[RawJSON, Dict[str, Any]]:
+    vs_currency = vs_currency.lower()
+
+    # 1) Fatia do snapshot em memória (sem rede)
+    hit = market_snapshots.page(vs_currency, per_page, page, settings.MARKET_SNAPSHOT_MAX_AGE_SEC)
+    if hit is not None:
+        raw, snap = hit
+        return raw, {
+            "source": "snapshot",
+            "age": snap.age,
+            "fetched_at": snap.fetched_at,
+            "ttl": settings.MARKET_SNAPSHOT_INTERVAL_SEC,
+            "version": ("snapshot", snap.fetched_at),
+        }
+
+    # 2) Cache por página (fora do snapshot: moeda não configurada ou página além do top-N)
+    key = (vs_currency, per_page, page)
+    ttl = settings.MARKETS_CACHE_TTL_BY_CURRENCY.get(vs_currency)
+    raw = await markets_cache.get_or_load(
+        key,
+        lambda: _fetch_markets_raw(vs_currency, per_page, page),
+        ttl=ttl,
+    )
+    age = markets_cache.age(key) or 0.0
+    return raw, {
+        "source": "cache",
+        "age": age,
+        "fetched_at": time.time() - age,
+        "ttl": ttl if ttl is not None else settings.MARKETS_CACHE_TTL,
+        "version": id(raw),  # mesmo objeto enquanto a entrada do cache não muda
+    }
+
+# Campos do payload compacto do endpoint em lote
+COMPACT_FIELDS = (
+    "id",
+    "symbol",
+    "name",
+    "image",
+    "current_price",
+    "market_cap",
+    "market_cap_rank",
+    "total_volume",
+    "price_change_percentage_24h",
+    "last_updated",
+)
+
+def _compact(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {f: item.get(f) for f in COMPACT_FIELDS}
+
+# Várias moedas de uma vez: resolve ids no índice local, usa o snapshot e busca o resto
+# em /coins/markets?ids=... (em blocos de BATCH_CHUNK_SIZE ids por chamada)
+async def fetch_coins_batch(ids: List[str], vs_currency: str) -> Dict[str, Any]:
+    vs_currency = vs_currency.lower()
+    # Sem índice carregado, assume que já são ids (não gasta uma chamada por moeda)
+    resolved = [(coin_index.resolve(i) if coin_index.ready else i) for i in ids]
+    real_ids = list(dict.fromkeys(r for r in resolved if r))
+
+    found = market_snapshots.lookup(vs_currency, real_ids, settings.MARKET_SNAPSHOT_MAX_AGE_SEC)
+    pending = [i for i in real_ids if i not in found]
+    size = settings.BATCH_CHUNK_SIZE
+    chunks = [pending[k:k + size] for k in range(0, len(pending), size)]
+    responses = await asyncio.gather(*(
+        _get("/coins/markets", {
+            "vs_currency": vs_currency,
+            "ids": ",".join(chunk),
+            "per_page": len(chunk),
+            "page": 1,
+            "sparkline": "false",
+            "price_change_percentage": "24h",
+        })
+        for chunk in chunks
+    ))
+    for r in responses:
+        for item in loads(r.content) or []:
+            if item.get("id"):
+                found[item["id"]] = item
+
+    return {
+        "vs_currency": vs_currency,
+        "coins": [_compact(found[i]) for i in real_ids if i in found],
+        "missing": [i for i, r in zip(ids, resolved) if r not in found],
+    }
+
+# Atualiza o snapshot top-N de cada moeda configurada (páginas de 250, em sequência)
+async def refresh_market_snapshots() -> Dict[str, int]:
+    size = settings.MARKET_SNAPSHOT_SIZE
+    pages = -(-size // 250)
+    done: Dict[str, int] = {}
+    for cur in settings.MARKET_SNAPSHOT_CURRENCIES:
+        items: List[Dict[str, Any]] = []
+        for p in range(1, pages + 1):
+            chunk = await _fetch_markets_upstream(cur, 250, p)
+            items.extend(chunk or [])
+            if len(chunk or []) < 250:
+                break
+        market_snapshots.put(cur, items[:size])
+        price_broadcaster.publish(cur, items[:size])
+        done[cur] = len(items[:size])
+    return done
+
+# Maiores altas e baixas da semana (uma chamada; usada pelo digest semanal)
+async def fetch_weekly_movers(vs_currency: str, limit: int, universe: int = 100) -> Dict[str, List[Dict[str, Any]]]:
+    params = {
+        "vs_currency": vs_currency,
+        "order": "market_cap_desc",
+        "per_page": universe,
+        "page": 1,
+        "sparkline": "false",
+        "price_change_percentage": "7d",
+    }
     r = await _get("/coins/markets", params)
-    return r.json()
+    key = "price_change_percentage_7d_in_currency"
+    coins = [c for c in loads(r.content) if c.get(key) is not None]
+    coins.sort(key=lambda c: c[key], reverse=True)
+    return {"gainers": coins[:limit], "losers": coins[::-1][:limit]}
 
 async def fetch_coin_detail(coin_id: str) -> Dict[str, Any]:
+    raw, _ = await fetch_coin_detail_with_meta(coin_id)
+    return raw.data
+
+# Detalhe da moeda em cache (SWR) como bytes do upstream; meta traz id, idade e TTL
+async def fetch_coin_detail_with_meta(coin_id: str) -> tuple[RawJSON, Dict[str, Any]]:
     real_id = await _resolve_coin_id(coin_id)
     params = {
         "localization": "false",
@@ -94,13 +278,46 @@ async def fetch_coin_detail(coin_id: str) -> Dict[str, Any]:
         "developer_data": "false",
         "sparkline": "false",
     }
-    r = await _get(f"/coins/{real_id}", params)
-    return r.json()
+
+    async def load() -> RawJSON:
+        r = await _get(f"/coins/{real_id}", params)
+        return RawJSON(r.content)
+
+    raw = await coin_cache.get_or_load(real_id, load)
+    return raw, {"id": real_id, "age": coin_cache.age(real_id) or 0.0, "ttl": settings.COIN_DETAIL_CACHE_TTL}
+
+# Série diária de preços [(epoch_s, preço)] dos últimos `days` dias
+async def fetch_price_series(coin_id: str, vs_currency: str, days: int) -> List[tuple[float, float]]:
+    vs_currency = vs_currency.lower()
+
+    async def load() -> List[tuple[float, float]]:
+        r = await _get(f"/coins/{coin_id}/market_chart", {"vs_currency": vs_currency, "days": days, "interval": "daily"})
+        prices = (loads(r.content) or {}).get("prices") or []
+        return [(ts / 1000.0, float(p)) for ts, p in prices if p is not None]
+
+    return await series_cache.get_or_load((coin_id, vs_currency, days), load)
+
+# Série já em cache (sem rede); None se ainda não foi buscada ou venceu
+def cached_price_series(coin_id: str, vs_currency: str, days: int) -> Optional[List[tuple[float, float]]]:
+    return series_cache.peek((coin_id, vs_currency.lower(), days))
 
 #Busca nunca levanta 404; retorna sempre lista (vazia ou não)
 async def search_coins(q: str) -> Dict[str, Any]:
+    if coin_index.ready:
+        return {"query": q, "coins": coin_index.search(q)}
     r = await _get("/search", {"query": q})
-    data = r.json() if isinstance(r.json(), dict) else {}
+    data = loads(r.content)  # um único parse
+    data = data if isinstance(data, dict) else {}
     return {"query": q, "coins": data.get("coins", [])}
 
-__all__ = ["fetch_markets", "fetch_coin_detail", "search_coins"]
+# Recarrega o índice local a partir de /coins/list (+ top 250 para rank/imagem)
+async def refresh_coin_index() -> int:
+    coins = loads((await _get("/coins/list")).content)
+    try:
+        top = await _fetch_markets_upstream("usd", 250, 1)
+    except HTTPException:
+        top = []
+    coin_index.load(coins if isinstance(coins, list) else [], top if isinstance(top, list) else [])
+    return len(coin_index.by_id)
+
+__all__ = ["fetch_markets", "fetch_coin_detail", "search_coins", "fetch_coins_batch", "fetch_price_series", "cached_price_series", "refresh_coin_index"]
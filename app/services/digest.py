@@ -0,0 +1,188 @@
+# Digest semanal da newsletter
+# - Conteúdo (maiores altas/baixas da semana + notícias) montado uma vez por execução
+# - Um template por segmento (membro/visitante), renderizado uma vez; por destinatário só entra o link de descadastro
+# - Inscritos lidos em lotes de tamanho fixo por keyset (id > último), com o próximo lote já buscado
+#   enquanto o atual é enviado: memória constante para qualquer número de inscritos
+# - Checkpoint por lote em digest_runs: se o processo cair, a próxima execução continua de onde parou
+#   (só o dono do lease grava; quem perdeu o lease para no próximo checkpoint)
+# - Falhas transitórias vão para a fila de e-mails (mail_queue), que tenta de novo com backoff
+
+from __future__ import annotations
+import asyncio
+import html
+import logging
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.db.models import DigestRun, NewsletterSubscription
+from app.services.coingecko import fetch_weekly_movers
+from app.services.email import MailDeliveryError, MailMessage, mailer
+from app.services.mail_queue import enqueue_many
+from app.services.news_store import news_store
+from app.services.newsletter_outbox import list_unsubscribe_headers, unsubscribe_url
+
+logger = logging.getLogger(__name__)
+
+SEGMENTS = ("member", "guest")
+UNSUBSCRIBE = "{{unsubscribe_url}}"  # trocado por destinatário (str.replace, sem re-renderizar)
+
+
+def week_key(now: Optional[datetime] = None) -> str:
+    year, week, _ = (now or datetime.now(timezone.utc)).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _segment(user_id: Any) -> str:
+    return "member" if user_id is not None else "guest"
+
+
+async def build_content() -> Dict[str, Any]:
+    vs = settings.DIGEST_VS_CURRENCY
+    movers = await fetch_weekly_movers(vs, settings.DIGEST_MOVERS)
+    news = news_store.latest((settings.NEWS_LANGUAGE or "pt").lower(), settings.DIGEST_NEWS)
+    return {"vs_currency": vs, "movers": movers, "news": news}
+
+
+def _rows(coins: List[Dict[str, Any]], vs: str) -> str:
+    key = "price_change_percentage_7d_in_currency"
+    return "".join(
+        f"<tr><td>{html.escape(c.get('name') or c.get('id') or '')}</td>"
+        f"<td>{c.get('current_price')} {html.escape(vs.upper())}</td>"
+        f"<td>{c[key]:+.2f}%</td></tr>"
+        for c in coins
+    )
+
+
+def render(segment: str, content: Dict[str, Any], week: str) -> str:
+    vs = content["vs_currency"]
+    news = "".join(
+        f'<li><a href="{html.escape(n["link"])}">{html.escape(n["title"])}</a> — {html.escape(n["source"])}</li>'
+        for n in content["news"]
+    )
+    if segment == "member":
+        cta = f'<p><a href="{html.escape(settings.FRONTEND_URL)}/favoritos">Veja como estão seus favoritos</a></p>'
+    else:
+        cta = f'<p><a href="{html.escape(settings.FRONTEND_URL)}/cadastro">Crie sua conta e acompanhe suas moedas favoritas</a></p>'
+    return f"""
+    <h2>Resumo da semana {week}</h2>
+    <h3>Maiores altas (7d)</h3>
+    <table>{_rows(content["movers"]["gainers"], vs)}</table>
+    <h3>Maiores baixas (7d)</h3>
+    <table>{_rows(content["movers"]["losers"], vs)}</table>
+    {f"<h3>Notícias</h3><ul>{news}</ul>" if news else ""}
+    {cta}
+    <p><small><a href="{UNSUBSCRIBE}">Cancelar inscrição</a></small></p>
+    """
+
+
+# Reserva a execução da semana (lease); None se outro worker está com ela ou se já terminou
+# Retorna (último inscrito processado, token do lease)
+async def _claim_run(db: AsyncSession, week: str, create: bool) -> Optional[Tuple[Any, str]]:
+    if create:
+        await db.execute(insert(DigestRun).values(week=week).on_conflict_do_nothing(index_elements=["week"]))
+    now = datetime.now(timezone.utc)
+    token = secrets.token_hex(16)
+    row = (await db.execute(
+        update(DigestRun)
+        .where(
+            DigestRun.week == week,
+            DigestRun.status == "running",
+            or_(DigestRun.lease_until.is_(None), DigestRun.lease_until < now),
+        )
+        .values(lease_until=now + timedelta(seconds=settings.DIGEST_LEASE_SEC), lease_token=token, updated_at=now)
+        .returning(DigestRun.last_subscription_id)
+    )).first()
+    await db.commit()
+    return (row.last_subscription_id, token) if row is not None else None
+
+
+async def _next_chunk(after: Any) -> List[Any]:
+    async with AsyncSessionLocal() as db:
+        stmt = (
+            select(NewsletterSubscription.id, NewsletterSubscription.email, NewsletterSubscription.user_id)
+            .where(NewsletterSubscription.consent.is_(True))
+            .order_by(NewsletterSubscription.id)
+            .limit(settings.DIGEST_CHUNK_SIZE)
+        )
+        if after is not None:
+            stmt = stmt.where(NewsletterSubscription.id > after)
+        return (await db.execute(stmt)).all()
+
+
+# Executa (ou retoma) o digest da semana; resume_only=True só continua uma execução já iniciada
+async def run_weekly_digest(now: Optional[datetime] = None, resume_only: bool = False) -> Optional[Dict[str, Any]]:
+    week = week_key(now)
+    async with AsyncSessionLocal() as db:
+        claimed = await _claim_run(db, week, create=not resume_only)
+        if claimed is None:
+            return None
+        cursor, token = claimed
+        owned = (DigestRun.week == week, DigestRun.lease_token == token)
+
+        content = await build_content()
+        subject = f"{settings.DIGEST_SUBJECT} — {week}"
+        templates = {seg: render(seg, content, week) for seg in SEGMENTS}
+
+        sent = queued = 0
+        pending = asyncio.ensure_future(_next_chunk(cursor))
+        try:
+            while True:
+                chunk = await pending
+                if not chunk:
+                    break
+                pending = asyncio.ensure_future(_next_chunk(chunk[-1].id))  # busca o próximo enquanto envia
+
+                msgs = []
+                for r in chunk:
+                    url = unsubscribe_url(r.email)
+                    html_body = templates[_segment(r.user_id)].replace(UNSUBSCRIBE, html.escape(url))
+                    msgs.append(MailMessage(r.email, subject, html_body, list_unsubscribe_headers(r.email, url)))
+                results = await mailer.send_many(msgs, concurrency=settings.DIGEST_SEND_CONCURRENCY)
+
+                # Provedor fora do ar: a mensagem segue pela fila (dedupe_key evita duplicar na retomada)
+                retry = [
+                    {"to_email": m.to, "subject": m.subject, "html": m.html, "kind": "digest",
+                     "dedupe_key": f"digest:{week}:{m.to}"}
+                    for m, (_, err) in zip(msgs, results)
+                    if isinstance(err, MailDeliveryError)
+                ]
+                chunk_sent = sum(1 for provider, _ in results if provider)
+                if retry:
+                    await enqueue_many(db, retry)
+                now = datetime.now(timezone.utc)
+                res = await db.execute(
+                    update(DigestRun)
+                    .where(*owned)
+                    .values(
+                        last_subscription_id=chunk[-1].id,
+                        sent=DigestRun.sent + chunk_sent,
+                        queued=DigestRun.queued + len(retry),
+                        updated_at=now,
+                        lease_until=now + timedelta(seconds=settings.DIGEST_LEASE_SEC),
+                    )
+                )
+                await db.commit()  # checkpoint do lote
+                if not res.rowcount:
+                    # Lease expirou e outro worker assumiu: ele continua daqui, este para
+                    logger.warning("Digest %s: lease perdido, execução interrompida", week)
+                    return None
+                sent += chunk_sent
+                queued += len(retry)
+        finally:
+            pending.cancel()
+
+        res = await db.execute(
+            update(DigestRun)
+            .where(*owned)
+            .values(status="done", lease_until=None, lease_token=None, finished_at=datetime.now(timezone.utc))
+        )
+        await db.commit()
+        if not res.rowcount:
+            logger.warning("Digest %s: lease perdido antes de finalizar", week)
+            return None
+    return {"week": week, "sent": sent, "queued": queued}
@@ -1,8 +1,21 @@
+# Envio de e-mails
+# - Provedores em ordem de preferência: Resend (HTTP) e SMTP
+# - Cada provedor tem um circuit breaker: se está falhando, o próximo assume sem esperar timeout
+# - Resend: envios concorrentes, limitados por semáforo e pela cota do governador
+# - SMTP: pool de sessões já autenticadas (sem handshake/STARTTLS/login por mensagem)
+
+import asyncio
 import os
 import logging
+import time
 from email.message import EmailMessage
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
 import aiosmtplib
 import httpx
+from app.core.circuit import CircuitBreaker
+from app.core.config import settings
+from app.core.governor import governed_request
+from app.core.http import get_client
 
 logger = logging.getLogger(__name__)
 
@@ -18,43 +31,208 @@ RESEND_API_KEY = os.getenv("RESEND_API_KEY")
 
 SENDER_EMAIL = os.getenv("SENDER_EMAIL", "no-reply@example.com")
 
-async def send_email(to: str, subject: str, html: str):
-    # 1) Tenta via Resend API (HTTP) se houver chave
-    if RESEND_API_KEY:
-        try:
-            async with httpx.AsyncClient(timeout=20) as client:
-                r = await client.post(
-                    "https://api.resend.com/emails",
-                    headers={"Authorization": f"Bearer {RESEND_API_KEY}"},
-                    json={"from": SENDER_EMAIL, "to": to, "subject": subject, "html": html},
-                )
-            r.raise_for_status()
-            logger.info("E-mail enviado via Resend para %s", to)
-            return
-        except Exception as e:
-            logger.exception("Falha Resend: %s — tentando SMTP...", e)
-            # cai para SMTP
-
-    # 2) Fallback: SMTP (pode falhar se portas bloqueadas)
-    msg = EmailMessage()
-    msg["From"] = SENDER_EMAIL
-    msg["To"] = to
-    msg["Subject"] = subject
-    msg.set_content(html, subtype="html")
-
-    try:
+
+class MailMessage(NamedTuple):
+    to: str
+    subject: str
+    html: str
+    headers: Optional[Dict[str, str]] = None  # ex.: List-Unsubscribe
+
+
+class PermanentMailError(RuntimeError):
+    """O provedor recusou a mensagem em si (destinatário/conteúdo); repetir não adianta."""
+
+
+class MailDeliveryError(RuntimeError):
+    """Nenhum provedor conseguiu entregar a mensagem."""
+
+
+class _ResendProvider:
+    name = "resend"
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(RESEND_API_KEY)
+
+    async def send(self, msg: MailMessage) -> None:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.concurrency)
+        client = get_client("resend")
+        payload = {"from": SENDER_EMAIL, "to": msg.to, "subject": msg.subject, "html": msg.html}
+        if msg.headers:
+            payload["headers"] = msg.headers
+        headers = {"Authorization": f"Bearer {RESEND_API_KEY}"}
+        async with self._sem:
+            r = await governed_request("resend", lambda: client.post("/emails", headers=headers, json=payload))
+        if r.status_code in (400, 422):
+            raise PermanentMailError(f"Resend recusou a mensagem ({r.status_code}): {r.text[:200]}")
+        r.raise_for_status()
+
+
+class _SMTPProvider:
+    name = "smtp"
+
+    def __init__(self, pool_size: int, max_messages: int, idle_timeout: float):
+        self.pool_size = pool_size
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._idle: List[Tuple[aiosmtplib.SMTP, float, int]] = []  # (conexão, último uso, enviadas)
+        self._quitting: Set[asyncio.Task] = set()  # referência forte até o QUIT terminar
+        self.connects = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(os.getenv("SMTP_HOST") or SMTP_USER)
+
+    async def _connect(self) -> aiosmtplib.SMTP:
         use_ssl = (SMTP_PORT == 465) or (not SMTP_TLS)
-        await aiosmtplib.send(
-            msg,
+        conn = aiosmtplib.SMTP(
             hostname=SMTP_HOST,
             port=SMTP_PORT,
-            username=SMTP_USER,
-            password=SMTP_PASS,
-            start_tls=not use_ssl,   # 587
             use_tls=use_ssl,         # 465
+            start_tls=not use_ssl,   # 587
             timeout=25,
         )
-        logger.info("E-mail enviado via SMTP para %s", to)
-    except Exception as e:
-        logger.exception("Falha SMTP: %s", e)
-        raise
+        await conn.connect()
+        if SMTP_USER:
+            await conn.login(SMTP_USER, SMTP_PASS or "")
+        self.connects += 1
+        return conn
+
+    async def _acquire(self) -> Tuple[aiosmtplib.SMTP, int]:
+        while self._idle:
+            conn, last_used, sent = self._idle.pop()
+            if conn.is_connected and time.monotonic() - last_used < self.idle_timeout:
+                return conn, sent
+            await self._quit(conn)
+        return await self._connect(), 0
+
+    def _release(self, conn: aiosmtplib.SMTP, sent: int) -> None:
+        # Servidores costumam limitar mensagens por sessão: recicla antes disso
+        if sent >= self.max_messages:
+            task = asyncio.ensure_future(self._quit(conn))
+            self._quitting.add(task)
+            task.add_done_callback(self._quitting.discard)
+        else:
+            self._idle.append((conn, time.monotonic(), sent))
+
+    async def _quit(self, conn: aiosmtplib.SMTP) -> None:
+        try:
+            await conn.quit()
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                logger.debug("Falha ao fechar conexão SMTP", exc_info=True)
+
+    async def send(self, msg: MailMessage) -> None:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.pool_size)
+        em = EmailMessage()
+        em["From"] = SENDER_EMAIL
+        em["To"] = msg.to
+        em["Subject"] = msg.subject
+        for name, value in (msg.headers or {}).items():
+            em[name] = value
+        em.set_content(msg.html, subtype="html")
+
+        async with self._sem:
+            conn, sent = await self._acquire()
+            try:
+                await conn.send_message(em)
+            except (aiosmtplib.SMTPRecipientsRefused, aiosmtplib.SMTPSenderRefused) as e:
+                # Sessão continua válida; o problema é a mensagem
+                self._release(conn, sent + 1)
+                raise PermanentMailError(f"SMTP recusou a mensagem: {e}")
+            except Exception:
+                await self._quit(conn)
+                raise
+            self._release(conn, sent + 1)
+
+    async def close(self) -> None:
+        idle, self._idle = self._idle, []
+        for conn, _, _ in idle:
+            await self._quit(conn)
+        if self._quitting:
+            await asyncio.gather(*self._quitting, return_exceptions=True)
+
+
+class Mailer:
+    def __init__(self):
+        self.providers = [
+            _ResendProvider(settings.MAIL_RESEND_CONCURRENCY),
+            _SMTPProvider(settings.MAIL_SMTP_POOL_SIZE, settings.MAIL_SMTP_MAX_MESSAGES, settings.MAIL_SMTP_IDLE_SEC),
+        ]
+        self.breakers = {
+            p.name: CircuitBreaker(p.name, settings.MAIL_BREAKER_FAILURES, settings.MAIL_BREAKER_RESET_SEC)
+            for p in self.providers
+        }
+
+    # Envia por um provedor disponível; retorna o nome de quem entregou
+    async def send(self, msg: MailMessage) -> str:
+        last: Optional[Exception] = None
+        for provider in self.providers:
+            breaker = self.breakers[provider.name]
+            if not provider.enabled or not breaker.allow():
+                continue
+            try:
+                await provider.send(msg)
+            except PermanentMailError:
+                breaker.on_success()  # provedor respondeu; falha é da mensagem
+                raise
+            except (httpx.HTTPError, aiosmtplib.SMTPException, OSError, asyncio.TimeoutError, RuntimeError) as e:
+                breaker.on_failure()
+                last = e
+                logger.warning("Falha no envio via %s para %s: %s", provider.name, msg.to, e)
+                continue
+            except Exception:
+                breaker.on_failure()  # erro inesperado do provedor também conta (e libera o half-open)
+                raise
+            except BaseException:
+                breaker.release()  # cancelamento: não diz nada sobre o provedor
+                raise
+            breaker.on_success()
+            logger.info("E-mail enviado via %s para %s", provider.name, msg.to)
+            return provider.name
+        raise MailDeliveryError(str(last) if last else "Nenhum provedor de e-mail disponível")
+
+    # Vários envios em paralelo (limitados por concurrency, se informado, e por cada provedor)
+    # Retorna, na mesma ordem, (provedor, None) ou (None, erro)
+    async def send_many(
+        self, msgs: List[MailMessage], concurrency: Optional[int] = None
+    ) -> List[Tuple[Optional[str], Optional[Exception]]]:
+        sem = asyncio.Semaphore(concurrency or len(msgs) or 1)
+
+        async def one(m: MailMessage):
+            async with sem:
+                try:
+                    return await self.send(m), None
+                except (PermanentMailError, MailDeliveryError) as e:
+                    return None, e
+        return list(await asyncio.gather(*(one(m) for m in msgs)))
+
+    async def close(self) -> None:
+        for provider in self.providers:
+            if hasattr(provider, "close"):
+                await provider.close()
+
+    def stats(self):
+        smtp = next(p for p in self.providers if p.name == "smtp")
+        return {
+            "breakers": {name: b.stats() for name, b in self.breakers.items()},
+            "smtp_connects": smtp.connects,
+            "smtp_idle": len(smtp._idle),
+        }
+
+
+mailer = Mailer()
+
+
+async def send_email(to: str, subject: str, html: str):
+    # Envio direto (sem fila); levanta MailDeliveryError/PermanentMailError se não entregar
+    return await mailer.send(MailMessage(to, subject, html))
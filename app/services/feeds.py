@@ -0,0 +1,214 @@
+# Agregador de feeds RSS/Atom (NEWS_FEEDS)
+# - Todos os feeds são consultados em paralelo, com limite (NEWS_FEEDS_CONCURRENCY)
+# - GET condicional (If-None-Match / If-Modified-Since): feed sem novidade custa um 304 sem corpo
+# - Só entradas a partir da última já lida viram notícias; as do mesmo instante e as sem data
+#   são reconhecidas pelo hash da URL (seen), então nada se repete nem se perde a cada rodada
+# - As notícias vão para o mesmo acervo da NewsAPI (news_store), com dedupe pelo hash da URL
+
+from __future__ import annotations
+import asyncio
+import calendar
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+import feedparser
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.http import get_client
+from app.db.models import NewsFeed
+from app.db.schemas import NewsItem
+from app.services.news_store import save_items, url_hash
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FeedState:
+    url: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    last_entry_at: Optional[datetime] = None
+    last_status: Optional[int] = None
+    last_polled_at: Optional[datetime] = None
+    seen: Set[str] = field(default_factory=set)
+
+
+_states: Dict[str, FeedState] = {}
+_loaded = False
+
+
+def _entry_time(entry: Any) -> Optional[datetime]:
+    parsed = entry.get("published_parsed") or entry.get("updated_parsed")
+    if not parsed:
+        return None
+    return datetime.fromtimestamp(calendar.timegm(parsed), tz=timezone.utc)
+
+
+def _entry_image(entry: Any) -> Optional[str]:
+    for key in ("media_content", "media_thumbnail"):
+        for media in entry.get(key) or []:
+            if media.get("url"):
+                return media["url"]
+    for link in entry.get("links") or []:
+        if link.get("rel") == "enclosure" and (link.get("type") or "").startswith("image/"):
+            return link.get("href")
+    return None
+
+
+def _feed_language(parsed: Any, configured: str) -> str:
+    if configured:
+        return configured
+    lang = (parsed.feed.get("language") or "").split("-")[0].strip().lower()
+    return lang or (settings.NEWS_LANGUAGE or "pt").lower()
+
+
+# Converte só as entradas novas; retorna (itens, nova última entrada, hashes já vistos)
+# Empate com a última entrada lida não basta para descartar: decide o hash da URL
+# Entrada sem data entra uma vez só, com a hora em que foi vista (o acervo guarda essa primeira data)
+def _new_items(parsed: Any, state: FeedState) -> Tuple[List[NewsItem], Optional[datetime], Set[str]]:
+    source = parsed.feed.get("title") or ""
+    now = datetime.now(timezone.utc)
+    entries = []
+    for entry in parsed.entries:
+        title = (entry.get("title") or "").strip()
+        link = entry.get("link") or ""
+        if title and link:
+            ts = _entry_time(entry)
+            # Data no futuro (relógio/fuso errado no feed) vira "agora": senão travaria a última entrada lida
+            if ts is not None and ts > now:
+                ts = now
+            entries.append((entry, title, link, url_hash(link), ts))
+
+    stamps = [ts for *_, ts in entries if ts is not None]
+    # A posição já gravada também é limitada a agora
+    last = min(state.last_entry_at, now) if state.last_entry_at is not None else None
+    if last is not None:
+        stamps.append(last)
+    newest = max(stamps, default=None)
+    items: List[NewsItem] = []
+    for entry, title, link, h, ts in entries:
+        if h in state.seen:
+            continue
+        if ts is not None and last is not None and ts < last:
+            continue
+        items.append(NewsItem(
+            title=title,
+            link=link,
+            source=source,
+            image=_entry_image(entry),
+            published_at=(ts or now).isoformat(),
+        ))
+    # Só o que ainda está no feed: o conjunto não cresce além do tamanho do feed
+    seen = {h for *_, h, ts in entries if ts is None or ts == newest}
+    return items, newest, seen
+
+
+# Retorna (feed parseado ou None se 304, entradas novas, novos validadores/posição)
+# Os validadores só são aplicados depois que as entradas foram gravadas
+async def _poll(state: FeedState) -> Tuple[Optional[Any], List[NewsItem], Dict[str, Any]]:
+    headers = {}
+    if state.etag:
+        headers["If-None-Match"] = state.etag
+    if state.last_modified:
+        headers["If-Modified-Since"] = state.last_modified
+
+    r = await get_client("feeds").get(state.url, headers=headers, follow_redirects=True)
+    update: Dict[str, Any] = {"last_status": r.status_code, "last_polled_at": datetime.now(timezone.utc)}
+    if r.status_code == 304:
+        return None, [], update
+    r.raise_for_status()
+
+    # Parse fora do event loop (feeds grandes são CPU)
+    parsed = await asyncio.to_thread(feedparser.parse, r.content)
+    items, newest, seen = _new_items(parsed, state)
+    update.update(
+        etag=r.headers.get("ETag") or state.etag,
+        last_modified=r.headers.get("Last-Modified") or state.last_modified,
+        last_entry_at=newest,
+        seen=seen,
+    )
+    return parsed, items, update
+
+
+async def _load_states(db: Optional[AsyncSession]) -> None:
+    global _loaded
+    if _loaded:
+        return
+    if db is not None:
+        for row in (await db.execute(select(NewsFeed))).scalars():
+            _states[row.url] = FeedState(
+                url=row.url,
+                etag=row.etag,
+                last_modified=row.last_modified,
+                last_entry_at=row.last_entry_at,
+                last_status=row.last_status,
+                last_polled_at=row.last_polled_at,
+                seen=set((row.seen_hashes or "").split()),
+            )
+    _loaded = True
+
+
+async def _save_states(db: AsyncSession, states: List[FeedState]) -> None:
+    if not states:
+        return
+    rows = [
+        {"url": s.url, "etag": s.etag, "last_modified": s.last_modified, "last_entry_at": s.last_entry_at,
+         "last_status": s.last_status, "last_polled_at": s.last_polled_at, "seen_hashes": " ".join(sorted(s.seen))}
+        for s in states
+    ]
+    stmt = insert(NewsFeed).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["url"],
+        set_={c: stmt.excluded[c] for c in ("etag", "last_modified", "last_entry_at", "last_status", "last_polled_at",
+                                            "seen_hashes")},
+    )
+    await db.execute(stmt)
+    await db.commit()
+
+
+# Job: consulta todos os feeds e grava as entradas novas no acervo; retorna novas por feed
+async def refresh_feeds(db: Optional[AsyncSession]) -> Dict[str, int]:
+    feeds = settings.NEWS_FEEDS
+    if not feeds:
+        return {}
+    await _load_states(db)
+    sem = asyncio.Semaphore(max(1, settings.NEWS_FEEDS_CONCURRENCY))
+
+    async def one(url: str):
+        state = _states.setdefault(url, FeedState(url=url))
+        async with sem:
+            try:
+                parsed, items, update = await _poll(state)
+            except Exception as e:
+                logger.warning("Falha ao ler feed %s: %s", url, e)
+                parsed, items, update = None, [], {"last_status": None, "last_polled_at": datetime.now(timezone.utc)}
+        return state, parsed, items, update
+
+    results = await asyncio.gather(*(one(url) for _, url in feeds))
+
+    # Gravação em sequência: a sessão do banco não é compartilhável entre tarefas
+    by_language: Dict[str, List[NewsItem]] = {}
+    for (configured, url), (state, parsed, items, _) in zip(feeds, results):
+        if items:
+            by_language.setdefault(_feed_language(parsed, configured), []).extend(items)
+    inserted: Set[str] = set()
+    for language, items in by_language.items():
+        inserted |= await save_items(db, language, items)
+
+    # Conta só o que de fato entrou no acervo (URL já vista por outra fonte não é nova), uma vez por URL
+    added: Dict[str, int] = {}
+    for (_, url), (_, _, items, _) in zip(feeds, results):
+        new = {url_hash(it.link) for it in items} & inserted
+        inserted -= new
+        added[url] = len(new)
+
+    # Entradas gravadas: agora avança ETag/Last-Modified e a última entrada lida
+    for state, _, _, update in results:
+        for key, value in update.items():
+            setattr(state, key, value)
+    if db is not None:
+        await _save_states(db, [state for state, _, _, _ in results])
+    return added
@@ -0,0 +1,175 @@
+# Fila persistente de e-mails
+# - Quem envia só grava na tabela mail_queue (na mesma transação do resto, se quiser)
+# - O dispatcher reserva lotes (SKIP LOCKED + lease), entrega pelo Mailer e grava o resultado
+# - Entrega ao menos uma vez: se o processo cair no meio, o lease expira e a mensagem volta para a fila
+# - Reset de senha: a linha guarda só ref_id (PasswordReset.id); o link é gerado no envio e nunca é gravado
+
+from __future__ import annotations
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.db.models import MailQueue
+from app.services.email import MailMessage, PermanentMailError, mailer
+from app.services import password_reset_mail as reset_mail
+from app.services.newsletter_outbox import list_unsubscribe_headers
+
+logger = logging.getLogger(__name__)
+
+PENDING, SENT, FAILED = "pending", "sent", "failed"
+MAX_BACKOFF = timedelta(hours=1)
+
+
+# Enfileira uma mensagem; não faz commit (fica na transação de quem chamou)
+async def enqueue_mail(
+    db: AsyncSession,
+    to: str,
+    subject: str,
+    html: Optional[str],
+    kind: str = "",
+    dedupe_key: Optional[str] = None,
+    ref_id: Optional[int] = None,
+) -> None:
+    await enqueue_many(db, [{"to_email": to, "subject": subject, "html": html, "kind": kind,
+                             "dedupe_key": dedupe_key, "ref_id": ref_id}])
+
+
+# Várias mensagens num único INSERT; dedupe_key repetida é ignorada. Retorna quantas entraram.
+async def enqueue_many(db: AsyncSession, rows: Iterable[Dict[str, Any]]) -> int:
+    rows = [{"kind": "", "dedupe_key": None, "ref_id": None, **r} for r in rows]
+    if not rows:
+        return 0
+    res = await db.execute(
+        insert(MailQueue)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=["dedupe_key"])
+        .returning(MailQueue.id)
+    )
+    return len(res.all())
+
+
+def _backoff(attempts: int) -> timedelta:
+    return min(MAX_BACKOFF, timedelta(seconds=settings.MAIL_RETRY_BACKOFF_SEC * 2 ** max(0, attempts - 1)))
+
+
+async def _claim(db: AsyncSession, limit: int) -> List[Any]:
+    now = datetime.now(timezone.utc)
+    due = (
+        select(MailQueue.id)
+        .where(MailQueue.status == PENDING, MailQueue.next_attempt_at <= now)
+        .order_by(MailQueue.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    rows = (await db.execute(
+        update(MailQueue)
+        .where(MailQueue.id.in_(due.scalar_subquery()))
+        .values(attempts=MailQueue.attempts + 1, next_attempt_at=now + timedelta(seconds=settings.MAIL_LEASE_SEC))
+        .returning(MailQueue.id, MailQueue.to_email, MailQueue.subject, MailQueue.html,
+                   MailQueue.kind, MailQueue.ref_id, MailQueue.attempts)
+        .execution_options(synchronize_session=False)
+    )).all()
+    await db.commit()
+    return rows
+
+
+def _outcome(row: Any, provider: Optional[str], error: Optional[Exception], now: datetime) -> Dict[str, Any]:
+    if error is None:
+        return {"id": row.id, "status": SENT, "provider": provider, "sent_at": now,
+                "html": None, "last_error": None, "next_attempt_at": now}
+    out = {"id": row.id, "status": PENDING, "provider": None, "sent_at": None,
+           "html": row.html, "last_error": str(error)[:500], "next_attempt_at": now + _backoff(row.attempts)}
+    if isinstance(error, PermanentMailError) or row.attempts >= settings.MAIL_MAX_ATTEMPTS:
+        out.update(status=FAILED, html=None, next_attempt_at=now)
+    return out
+
+
+class _Expired(PermanentMailError):
+    """Pedido de reset expirou ou já foi usado antes do envio."""
+
+
+# HTML de cada mensagem do lote; para reset de senha monta o link a partir do pedido
+async def _render(db: AsyncSession, rows: List[Any]) -> List[Optional[str]]:
+    out: List[Optional[str]] = []
+    for r in rows:
+        if r.kind == reset_mail.KIND and r.ref_id is not None:
+            out.append(await reset_mail.render_reset(db, r.ref_id))
+        else:
+            out.append(r.html or "")
+    await db.commit()
+    return out
+
+
+# Headers não ficam na fila: os do digest (descadastro em um clique) são refeitos no envio
+def _headers(row: Any) -> Optional[Dict[str, str]]:
+    return list_unsubscribe_headers(row.to_email) if row.kind == "digest" else None
+
+
+# Entrega as mensagens vencidas em lotes; retorna contagem por status
+async def dispatch_pending(db: AsyncSession) -> Dict[str, int]:
+    counts = {SENT: 0, PENDING: 0, FAILED: 0}
+    size = max(1, settings.MAIL_DISPATCH_BATCH)
+    while True:
+        rows = await _claim(db, size)
+        if not rows:
+            break
+        bodies = await _render(db, rows)
+        ready = [(r, b) for r, b in zip(rows, bodies) if b is not None]
+        sent = iter(await mailer.send_many([MailMessage(r.to_email, r.subject, b, _headers(r)) for r, b in ready]))
+        expired = (None, _Expired("pedido de redefinição expirado ou já usado"))
+        results = [next(sent) if b is not None else expired for b in bodies]
+        now = datetime.now(timezone.utc)
+        outcomes = [_outcome(r, provider, err, now) for r, (provider, err) in zip(rows, results)]
+        # UPDATE em lote por chave primária (executemany)
+        await db.execute(update(MailQueue), outcomes)
+        await db.commit()
+        for o in outcomes:
+            counts[o["status"]] += 1
+        # Nenhum provedor entregando: espera a próxima rodada
+        if len(rows) < size or not any(o["status"] == SENT for o in outcomes):
+            break
+    return counts
+
+
+_kick: Optional[asyncio.Task] = None
+
+
+# Dispara uma rodada do dispatcher agora (ex.: e-mail de reset), sem esperar o intervalo do scheduler
+def kick_dispatch() -> None:
+    global _kick
+    if AsyncSessionLocal is None or (_kick is not None and not _kick.done()):
+        return
+
+    async def run():
+        try:
+            async with AsyncSessionLocal() as db:
+                await dispatch_pending(db)
+        except Exception:
+            logger.exception("Falha no envio imediato da fila de e-mails")
+
+    _kick = asyncio.get_running_loop().create_task(run())
+
+
+# Apaga mensagens finalizadas (enviadas/falhas) mais antigas que a retenção
+# Reset de senha sai assim que o token expira (pendentes também: o envio já não serviria)
+async def purge_mail_queue(db: AsyncSession) -> int:
+    now = datetime.now(timezone.utc)
+    removed = (await db.execute(
+        delete(MailQueue).where(
+            MailQueue.kind == reset_mail.KIND,
+            MailQueue.created_at < now - timedelta(minutes=reset_mail.RESET_TOKEN_TTL_MIN),
+        )
+    )).rowcount or 0
+    if settings.MAIL_QUEUE_RETENTION_DAYS > 0:
+        cutoff = now - timedelta(days=settings.MAIL_QUEUE_RETENTION_DAYS)
+        res = await db.execute(
+            delete(MailQueue).where(MailQueue.status != PENDING, MailQueue.created_at < cutoff)
+        )
+        removed += res.rowcount or 0
+    await db.commit()
+    return removed
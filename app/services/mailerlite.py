@@ -4,10 +4,10 @@
 
 from __future__ import annotations
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 import httpx
-
-MAILERLITE_BASE_URL = "https://connect.mailerlite.com/api"
+from app.core.governor import governed_request
+from app.core.http import get_client
 
 
 def _headers() -> Dict[str, str]:
@@ -23,21 +23,26 @@ def _headers() -> Dict[str, str]:
         "Accept": "application/json",
     }
 
-#  Inscreve um email na MailerLite. Retorna dict com status/ids
-async def subscribe(email: str, name: Optional[str] = None, group_id: Optional[str] = None) -> Dict[str, Any]:
-    gid = group_id or os.getenv("MAILERLITE_GROUP_ID")
+BATCH_MAX = 50  # limite do endpoint /batch da MailerLite
+
 
+def _payload(email: str, name: Optional[str], gid: Optional[str]) -> Dict[str, Any]:
     payload: Dict[str, Any] = {"email": email}
     if name:
         payload["fields"] = {"name": name}
     if gid:
         payload["groups"] = [gid]
+    return payload
 
-    url = f"{MAILERLITE_BASE_URL}/subscribers"
+#  Inscreve um email na MailerLite. Retorna dict com status/ids
+async def subscribe(email: str, name: Optional[str] = None, group_id: Optional[str] = None) -> Dict[str, Any]:
+    gid = group_id or os.getenv("MAILERLITE_GROUP_ID")
+    payload = _payload(email, name, gid)
 
     try:
-        async with httpx.AsyncClient(timeout=20) as client:
-            resp = await client.post(url, json=payload, headers=_headers())
+        client = get_client("mailerlite")
+        headers = _headers()
+        resp = await governed_request("mailerlite", lambda: client.post("/subscribers", json=payload, headers=headers))
     except httpx.RequestError as e:
         # Erro de rede (ex.: DNS, timeout, SSL)
         raise RuntimeError(f"Falha de rede ao contatar MailerLite: {e!s}")
@@ -62,3 +67,37 @@ async def subscribe(email: str, name: Optional[str] = None, group_id: Optional[s
     except Exception:
         detail = {"text": resp.text}
     raise RuntimeError(f"MailerLite API error {resp.status_code}: {detail}")
+
+
+# Inscreve vários e-mails numa única chamada (POST /batch, até BATCH_MAX por vez)
+# Retorna, na mesma ordem, o código HTTP e o corpo de cada inscrição.
+# POST /subscribers é um upsert por e-mail na MailerLite, então reenviar é seguro.
+async def subscribe_batch(items: List[Tuple[str, Optional[str]]], group_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    if len(items) > BATCH_MAX:
+        raise ValueError(f"Máximo de {BATCH_MAX} inscrições por lote")
+    gid = group_id or os.getenv("MAILERLITE_GROUP_ID")
+    body = {
+        "requests": [
+            {"method": "POST", "path": "api/subscribers", "body": _payload(email, name, gid)}
+            for email, name in items
+        ]
+    }
+
+    try:
+        client = get_client("mailerlite")
+        headers = _headers()
+        resp = await governed_request("mailerlite", lambda: client.post("/batch", json=body, headers=headers))
+    except httpx.RequestError as e:
+        raise RuntimeError(f"Falha de rede ao contatar MailerLite: {e!s}")
+
+    if resp.status_code == 401:
+        raise RuntimeError("MailerLite rejeitou a chave (401). Verifique MAILERLITE_API_KEY.")
+    if resp.status_code == 429:
+        raise RuntimeError("MailerLite aplicou rate limit (429). Tente novamente em instantes.")
+    if resp.status_code != 200:
+        raise RuntimeError(f"MailerLite API error {resp.status_code}: {resp.text}")
+
+    responses = resp.json().get("responses") or []
+    if len(responses) != len(items):
+        raise RuntimeError("MailerLite devolveu um lote incompleto")
+    return [{"status": r.get("code"), "data": r.get("body")} for r in responses]
@@ -0,0 +1,61 @@
+# Snapshot do ranking de mercados (top-N por moeda de cotação)
+# - Preenchido por um job do APScheduler (coingecko.refresh_market_snapshots)
+# - /api/prices/markets responde qualquer página fatiando a lista em memória
+
+from __future__ import annotations
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from app.core.fastjson import RawJSON, dumps
+
+
+@dataclass
+class Snapshot:
+    items: List[Dict[str, Any]]
+    fetched_at: float  # epoch (segundos)
+    by_id: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    frags: List[bytes] = field(default_factory=list)  # cada item já serializado (fatias sem dump)
+
+    @property
+    def age(self) -> float:
+        return max(0.0, time.time() - self.fetched_at)
+
+
+class MarketSnapshots:
+    def __init__(self):
+        self._by_currency: Dict[str, Snapshot] = {}
+
+    def put(self, vs_currency: str, items: List[Dict[str, Any]]) -> None:
+        by_id = {it["id"]: it for it in items if it.get("id")}
+        frags = [dumps(it) for it in items]
+        self._by_currency[vs_currency.lower()] = Snapshot(items, time.time(), by_id, frags)
+
+    def get(self, vs_currency: str) -> Optional[Snapshot]:
+        return self._by_currency.get(vs_currency.lower())
+
+    def page(self, vs_currency: str, per_page: int, page: int, max_age: float) -> Optional[tuple[RawJSON, Snapshot]]:
+        # Devolve a fatia (JSON pronto) se o snapshot existir, for recente e cobrir a página pedida
+        snap = self.get(vs_currency)
+        if snap is None or snap.age > max_age:
+            return None
+        start = (page - 1) * per_page
+        end = start + per_page
+        if end > len(snap.items):
+            return None
+        return RawJSON(b"[" + b",".join(snap.frags[start:end]) + b"]"), snap
+
+    def lookup(self, vs_currency: str, ids: List[str], max_age: float) -> Dict[str, Dict[str, Any]]:
+        # Itens do snapshot para os ids pedidos (vazio se não houver snapshot recente)
+        snap = self.get(vs_currency)
+        if snap is None or snap.age > max_age:
+            return {}
+        return {i: snap.by_id[i] for i in ids if i in snap.by_id}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            cur: {"size": len(s.items), "age": round(s.age, 1)}
+            for cur, s in self._by_currency.items()
+        }
+
+
+market_snapshots = MarketSnapshots()
@@ -1,28 +1,37 @@
 # API Newsapi
 
-from typing import List
-import httpx
+from typing import List, Optional
 from app.core.config import settings
+from app.core.governor import governed_request
+from app.core.http import get_client
+from app.core.singleflight import SingleFlight, make_key
 from app.db.schemas import NewsItem
 
-NEWSAPI_URL = "https://newsapi.org/v2/everything"
+NEWSAPI_PATH = "/everything"
 
-# Busca notícias recentes sobre cripto usando a NewsAPI, esta em pt(Portugues), puxa 20 noticias por vez.
-async def fetch_news() -> List[NewsItem]:
+# Requisições idênticas simultâneas à NewsAPI viram uma só
+news_flight = SingleFlight("newsapi")
+
+async def _get_upstream(params: dict) -> dict:
+    headers = {"X-Api-Key": settings.NEWSAPI_KEY}
+    client = get_client("newsapi")
+    r = await governed_request("newsapi", lambda: client.get(NEWSAPI_PATH, params=params, headers=headers))
+    r.raise_for_status()
+    return r.json()
+
+# Busca notícias recentes sobre cripto usando a NewsAPI (padrão: NEWS_LANGUAGE, 20 notícias).
+# Chamado pelo job do acervo de notícias (news_store); as rotas leem do acervo.
+async def fetch_news(language: Optional[str] = None, page_size: int = 20) -> List[NewsItem]:
     if not settings.NEWSAPI_KEY:
         # Retorna lista vazia se não configurado (não quebra o app)
         return []
     params = {
         "q": "(criptomoeda OR cripto OR bitcoin OR ethereum OR cryptocurrency)",
-        "pageSize": 20,
+        "pageSize": page_size,
         "sortBy": "publishedAt",
-        "language": settings.NEWS_LANGUAGE or "pt",
+        "language": language or settings.NEWS_LANGUAGE or "pt",
     }
-    headers = {"X-Api-Key": settings.NEWSAPI_KEY}
-    async with httpx.AsyncClient(timeout=20) as client:
-        r = await client.get(NEWSAPI_URL, params=params, headers=headers)
-        r.raise_for_status()
-        data = r.json()
+    data = await news_flight.do(make_key(NEWSAPI_PATH, params), lambda: _get_upstream(params))
 
     articles = data.get("articles", []) or []
     items: List[NewsItem] = []
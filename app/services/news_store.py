@@ -0,0 +1,244 @@
+# Acervo de notícias
+# - O scheduler busca a NewsAPI por idioma (e os feeds RSS/Atom, em feeds.py) em intervalo fixo
+#   e grava em news_articles (dedupe pelo hash da URL)
+# - As mais recentes de cada idioma ficam também em memória; /news/ serve daí e só vai ao banco
+#   para páginas mais antigas que a cópia em memória
+# - Paginação por cursor (published_at, url_hash), sempre do mais novo para o mais antigo
+# - Sem DATABASE_URL, o acervo vive só em memória
+
+from __future__ import annotations
+import base64
+import binascii
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.models import NewsArticle
+from app.db.schemas import NewsItem
+from app.services.news_service import fetch_news
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[datetime, str]  # (published_at, url_hash)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# Mesma notícia com utm_*/fragmento diferentes conta como uma só
+def url_hash(url: str) -> str:
+    parts = urlsplit(url.strip())
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query) if not k.lower().startswith("utm_")])
+    normalized = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), query, ""))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _parse_ts(raw: Optional[str]) -> datetime:
+    try:
+        ts = datetime.fromisoformat((raw or "").replace("Z", "+00:00"))
+        return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+    except ValueError:
+        return datetime.now(timezone.utc)
+
+
+def encode_cursor(key: Key) -> str:
+    raw = f"{key[0].isoformat()}|{key[1]}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Key:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        ts, h = raw.split("|", 1)
+        key = datetime.fromisoformat(ts)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(cursor)
+    # Nossos cursores sempre têm fuso; sem fuso a comparação com as chaves quebraria (TypeError)
+    if key.tzinfo is None:
+        raise InvalidCursor(cursor)
+    return key, h
+
+
+def _item(a: Any) -> Dict[str, Any]:
+    return {
+        "title": a.title,
+        "link": a.url,
+        "source": a.source,
+        "image": a.image,
+        "published_at": a.published_at.isoformat(),
+    }
+
+
+class NewsStore:
+    def __init__(self, size: int):
+        self.size = size
+        # idioma -> lista (chave, item) em ordem decrescente; complete = o banco não tem nada além disso
+        self._items: Dict[str, List[Tuple[Key, Dict[str, Any]]]] = {}
+        self._complete: Dict[str, bool] = {}
+        self.version = 0
+
+    def set(self, language: str, rows: List[Any], complete: bool) -> None:
+        self._items[language] = [((r.published_at, r.url_hash), _item(r)) for r in rows[: self.size]]
+        self._complete[language] = complete
+        self.version += 1
+
+    # Modo sem banco: junta as novas com as que já estão em memória; retorna os hashes das novas
+    def merge(self, language: str, rows: List[Any]) -> Set[str]:
+        current = {k[1]: (k, it) for k, it in self._items.get(language, [])}
+        added: Set[str] = set()
+        for r in rows:
+            if r.url_hash not in current:
+                current[r.url_hash] = ((r.published_at, r.url_hash), _item(r))
+                added.add(r.url_hash)
+        self._items[language] = sorted(current.values(), key=lambda e: e[0], reverse=True)[: self.size]
+        self._complete[language] = True
+        self.version += 1
+        return added
+
+    def has(self, language: str) -> bool:
+        return language in self._items
+
+    # Página a partir da memória; None se a página passa do que está em memória
+    def page(self, language: str, since: Optional[datetime], after: Optional[Key], limit: int):
+        items = self._items.get(language)
+        if items is None:
+            return None
+        out = [
+            (k, it) for k, it in items
+            if (after is None or k < after) and (since is None or k[0] >= since)
+        ]
+        reached_since = since is not None and items and items[-1][0][0] < since
+        if len(out) > limit or self._complete.get(language) or reached_since:
+            return out[: limit + 1]
+        return None
+
+    def languages(self) -> List[str]:
+        return list(self._items)
+
+    def latest(self, language: str, n: int) -> List[Dict[str, Any]]:
+        return [it for _, it in self._items.get(language, [])[:n]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"version": self.version, "languages": {l: len(v) for l, v in self._items.items()}}
+
+
+news_store = NewsStore(settings.NEWS_MEMORY_SIZE)
+
+
+class _Row:
+    # Linha em memória (modo sem banco) com os mesmos campos de NewsArticle
+    __slots__ = ("url_hash", "url", "title", "source", "image", "published_at")
+
+    def __init__(self, item: NewsItem):
+        self.url_hash = url_hash(item.link)
+        self.url = item.link
+        self.title = item.title
+        self.source = item.source or ""
+        self.image = item.image or None
+        self.published_at = _parse_ts(item.published_at)
+
+
+def _dedupe(items: List[NewsItem]) -> List[_Row]:
+    rows: Dict[str, _Row] = {}
+    for it in items:
+        row = _Row(it)
+        rows.setdefault(row.url_hash, row)
+    return list(rows.values())
+
+
+async def _load_language(db: AsyncSession, language: str) -> None:
+    rows = (await db.execute(
+        select(NewsArticle)
+        .where(NewsArticle.language == language)
+        .order_by(NewsArticle.published_at.desc(), NewsArticle.url_hash.desc())
+        .limit(news_store.size + 1)
+    )).scalars().all()
+    news_store.set(language, rows, complete=len(rows) <= news_store.size)
+
+
+# Grava notícias de qualquer fonte (NewsAPI, feeds RSS/Atom) no acervo; retorna os url_hash que eram novos
+# A mesma URL vinda de fontes diferentes vira uma única notícia (url_hash)
+async def save_items(db: Optional[AsyncSession], language: str, items: List[NewsItem]) -> Set[str]:
+    rows = _dedupe(items)
+    if db is None:
+        return news_store.merge(language, rows)
+    added: Set[str] = set()
+    if rows:
+        res = await db.execute(
+            insert(NewsArticle)
+            .values([
+                {"url_hash": r.url_hash, "url": r.url, "title": r.title, "source": r.source,
+                 "image": r.image, "language": language, "published_at": r.published_at}
+                for r in rows
+            ])
+            .on_conflict_do_nothing(index_elements=["url_hash"])
+            .returning(NewsArticle.url_hash)
+        )
+        added = set(res.scalars())
+        await db.commit()
+    if added or not news_store.has(language):
+        await _load_language(db, language)
+    return added
+
+
+# Job: uma chamada à NewsAPI por idioma, grava o que for novo e recarrega a cópia em memória
+async def refresh_news(db: Optional[AsyncSession]) -> Dict[str, int]:
+    added: Dict[str, int] = {}
+    for language in settings.NEWS_LANGUAGES:
+        try:
+            items = await fetch_news(language=language, page_size=settings.NEWS_FETCH_PAGE_SIZE)
+        except Exception:
+            # Mantém o acervo atual; tenta de novo na próxima rodada
+            logger.exception("Falha ao buscar notícias (%s)", language)
+            items = []
+        added[language] = len(await save_items(db, language, items))
+    return added
+
+
+# Página de notícias: memória quando possível, senão range scan no índice (language, published_at, url_hash)
+async def list_news(
+    db: Optional[AsyncSession],
+    language: str,
+    since: Optional[datetime],
+    cursor: Optional[str],
+    limit: int,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    after = decode_cursor(cursor) if cursor else None
+    page = news_store.page(language, since, after, limit)
+    if page is None and db is not None:
+        stmt = (
+            select(NewsArticle)
+            .where(NewsArticle.language == language)
+            .order_by(NewsArticle.published_at.desc(), NewsArticle.url_hash.desc())
+            .limit(limit + 1)
+        )
+        if after is not None:
+            stmt = stmt.where(tuple_(NewsArticle.published_at, NewsArticle.url_hash) < tuple_(*after))
+        if since is not None:
+            stmt = stmt.where(NewsArticle.published_at >= since)
+        rows = (await db.execute(stmt)).scalars().all()
+        page = [((r.published_at, r.url_hash), _item(r)) for r in rows]
+    page = page or []
+    next_cursor = encode_cursor(page[limit - 1][0]) if len(page) > limit else None
+    return [it for _, it in page[:limit]], next_cursor
+
+
+# Remove notícias fora da retenção e recarrega a cópia em memória
+async def purge_news(db: AsyncSession) -> int:
+    if settings.NEWS_RETENTION_DAYS <= 0:
+        return 0
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.NEWS_RETENTION_DAYS)
+    res = await db.execute(delete(NewsArticle).where(NewsArticle.published_at < cutoff))
+    await db.commit()
+    removed = res.rowcount or 0
+    # A cópia em memória não pode servir o que saiu do banco (e a versão nova invalida os ETags)
+    if removed:
+        for language in news_store.languages():
+            await _load_language(db, language)
+    return removed
@@ -0,0 +1,156 @@
+# Outbox da newsletter
+# - A rota só grava a inscrição no banco (rápido) e devolve 202
+# - O scheduler envia as pendentes para a MailerLite em lotes (/batch), com retry e backoff exponencial
+# - Um e-mail por linha: reinscrição de quem já sincronizou não chama a API de novo
+
+from __future__ import annotations
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlencode
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.security import unsubscribe_token
+from app.db.models import NewsletterOutbox, NewsletterSubscription
+from app.services.mailerlite import BATCH_MAX, subscribe_batch
+
+logger = logging.getLogger(__name__)
+
+PENDING, SYNCED, FAILED = "pending", "synced", "failed"
+MAX_BACKOFF = timedelta(hours=1)
+
+
+# Registra a inscrição e a coloca na fila; retorna "queued" ou "already_subscribed"
+async def enqueue(db: AsyncSession, email: str, name: Optional[str] = None) -> str:
+    email = email.strip().lower()
+    # Reinscrição de quem se descadastrou devolve o consentimento
+    await db.execute(
+        insert(NewsletterSubscription)
+        .values(email=email, consent=True)
+        .on_conflict_do_update(index_elements=["email"], set_={"consent": True})
+    )
+    stmt = insert(NewsletterOutbox).values(email=email, name=name, status=PENDING)
+    # Só uma linha falha volta para a fila; pendente ou sincronizada fica como está
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["email"],
+        set_={
+            "status": PENDING,
+            "attempts": 0,
+            "next_attempt_at": func.now(),
+            "last_error": None,
+            "name": func.coalesce(stmt.excluded.name, NewsletterOutbox.name),
+        },
+        where=NewsletterOutbox.status == FAILED,
+    ).returning(NewsletterOutbox.id)
+    queued = (await db.execute(stmt)).first() is not None
+    if not queued:
+        status = (await db.execute(select(NewsletterOutbox.status).where(NewsletterOutbox.email == email))).scalar_one()
+        queued = status != SYNCED
+    await db.commit()
+    return "queued" if queued else "already_subscribed"
+
+
+# Link de descadastro: GET mostra a confirmação; POST (botão ou one-click do cliente de e-mail) descadastra
+def unsubscribe_url(email: str) -> str:
+    query = urlencode({"email": email, "token": unsubscribe_token(email)})
+    return f"{settings.PUBLIC_API_URL}/api/newsletter/unsubscribe?{query}"
+
+
+# Headers de descadastro em um clique (RFC 8058)
+def list_unsubscribe_headers(email: str, url: Optional[str] = None) -> Dict[str, str]:
+    return {
+        "List-Unsubscribe": f"<{url or unsubscribe_url(email)}>",
+        "List-Unsubscribe-Post": "List-Unsubscribe=One-Click",
+    }
+
+
+# Descadastro (link do digest): só tira o consentimento; retorna False se o e-mail não está inscrito
+async def unsubscribe(db: AsyncSession, email: str) -> bool:
+    row = (await db.execute(
+        update(NewsletterSubscription)
+        .where(NewsletterSubscription.email == email.strip().lower())
+        .values(consent=False)
+        .returning(NewsletterSubscription.id)
+    )).first()
+    await db.commit()
+    return row is not None
+
+
+def _backoff(attempts: int) -> timedelta:
+    return min(MAX_BACKOFF, timedelta(seconds=settings.NEWSLETTER_SYNC_BACKOFF_SEC * 2 ** max(0, attempts - 1)))
+
+
+# Reserva um lote de pendentes (SKIP LOCKED: vários workers não pegam a mesma linha)
+# A reserva empurra next_attempt_at (lease): se o processo cair, a linha volta sozinha para a fila
+async def _claim(db: AsyncSession, limit: int) -> List[Any]:
+    now = datetime.now(timezone.utc)
+    due = (
+        select(NewsletterOutbox.id)
+        .where(NewsletterOutbox.status == PENDING, NewsletterOutbox.next_attempt_at <= now)
+        .order_by(NewsletterOutbox.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    rows = (await db.execute(
+        update(NewsletterOutbox)
+        .where(NewsletterOutbox.id.in_(due.scalar_subquery()))
+        .values(
+            attempts=NewsletterOutbox.attempts + 1,
+            next_attempt_at=now + timedelta(seconds=settings.NEWSLETTER_SYNC_LEASE_SEC),
+        )
+        .returning(NewsletterOutbox.id, NewsletterOutbox.email, NewsletterOutbox.name, NewsletterOutbox.attempts)
+        .execution_options(synchronize_session=False)
+    )).all()
+    await db.commit()
+    return rows
+
+
+def _outcome(row: Any, status: Optional[int], data: Any, error: Optional[str], now: datetime) -> Dict[str, Any]:
+    out = {"id": row.id, "status": PENDING, "next_attempt_at": now, "last_error": None, "provider_id": None, "synced_at": None}
+    if status in (200, 201, 409):
+        body = data if isinstance(data, dict) else {}
+        out.update(status=SYNCED, synced_at=now, provider_id=str((body.get("data") or body).get("id") or "") or None)
+        return out
+    out["last_error"] = (error or f"HTTP {status}: {data}")[:500]
+    # 429/5xx/erro de rede: tenta de novo; outros 4xx (ex.: e-mail inválido) não adiantam repetir
+    retryable = status is None or status == 429 or status >= 500
+    if not retryable or row.attempts >= settings.NEWSLETTER_SYNC_MAX_ATTEMPTS:
+        out["status"] = FAILED
+    else:
+        out["next_attempt_at"] = now + _backoff(row.attempts)
+    return out
+
+
+# Esvazia a fila em lotes; retorna contagem por status
+async def drain_outbox(db: AsyncSession) -> Dict[str, int]:
+    counts = {SYNCED: 0, PENDING: 0, FAILED: 0}
+    if not os.getenv("MAILERLITE_API_KEY"):
+        return counts
+    size = max(1, min(settings.NEWSLETTER_SYNC_BATCH, BATCH_MAX))
+    while True:
+        rows = await _claim(db, size)
+        if not rows:
+            break
+        now = datetime.now(timezone.utc)
+        try:
+            results = await subscribe_batch([(r.email, r.name) for r in rows])
+            outcomes = [_outcome(r, res["status"], res["data"], None, now) for r, res in zip(rows, results)]
+            failed_batch = False
+        except RuntimeError as e:
+            # Lote inteiro falhou (rede, 429, 5xx): todas voltam para a fila com backoff
+            logger.warning("Newsletter: lote não enviado à MailerLite: %s", e)
+            outcomes = [_outcome(r, None, None, str(e), now) for r in rows]
+            failed_batch = True
+        # UPDATE em lote por chave primária (executemany)
+        await db.execute(update(NewsletterOutbox), outcomes)
+        await db.commit()
+        for o in outcomes:
+            counts[o["status"]] += 1
+        # Provedor fora: espera a próxima rodada em vez de martelar com os próximos lotes
+        if failed_batch or len(rows) < size:
+            break
+    return counts
+
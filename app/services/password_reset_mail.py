@@ -0,0 +1,57 @@
+# E-mail de redefinição de senha
+# - O token em claro nunca vai para o banco: a fila guarda só o id do PasswordReset (mail_queue.ref_id)
+# - O token é derivado (HMAC com SECRET_KEY) do id e da validade do pedido: o dispatcher refaz o mesmo
+#   token a cada tentativa, então o link de uma tentativa que chegou (mas deu timeout) continua valendo
+# - Pedido expirado ou já usado antes do envio: a mensagem falha sem nova tentativa
+
+from __future__ import annotations
+import hashlib
+import hmac
+import os
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.models import PasswordReset, User
+
+FRONTEND_RESET_URL = os.getenv("FRONTEND_RESET_URL", "http://localhost:3000/resetar-senha")
+RESET_TOKEN_TTL_MIN = int(os.getenv("RESET_TOKEN_TTL_MIN", "30"))
+
+KIND = "password_reset"
+SUBJECT = "Redefinição de senha"
+
+
+# Token do pedido: sem SECRET_KEY não dá para calcular a partir do que está no banco
+def reset_token(reset_id: int, expires_at: datetime) -> str:
+    msg = f"password-reset:{reset_id}:{int(expires_at.timestamp())}".encode("utf-8")
+    return hmac.new(settings.SECRET_KEY.encode("utf-8"), msg, hashlib.sha256).hexdigest()
+
+
+def reset_link(raw_token: str) -> str:
+    return f"{FRONTEND_RESET_URL}?token={raw_token}"
+
+
+def reset_html(name: Optional[str], link: str) -> str:
+    return f"""
+        <p>Olá{f", {name}" if name else ''}!</p>
+        <p>Use o link abaixo para redefinir sua senha (válido por {RESET_TOKEN_TTL_MIN} minutos):</p>
+        <p><a href="{link}">Redefinir senha</a></p>
+        <p>Se você não solicitou, ignore este e-mail.</p>
+        """
+
+
+# HTML do pedido reset_id (mesmo token em toda tentativa); None se o pedido expirou ou já foi usado
+async def render_reset(db: AsyncSession, reset_id: int) -> Optional[str]:
+    row = (await db.execute(
+        select(PasswordReset.expires_at, User.name)
+        .join(User, User.id == PasswordReset.user_id)
+        .where(
+            PasswordReset.id == reset_id,
+            PasswordReset.used_at.is_(None),
+            PasswordReset.expires_at > datetime.now(timezone.utc),
+        )
+    )).first()
+    if row is None:
+        return None
+    return reset_html(row.name, reset_link(reset_token(reset_id, row.expires_at)))
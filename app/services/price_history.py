@@ -0,0 +1,142 @@
+# Histórico de preços (tabela price_candles)
+# - Cada amostra do snapshot atualiza, num único upsert, os candles de 1m, 1h e 1d
+# - Leituras do gráfico são range scans na chave primária (coin, moeda, intervalo, início)
+# - Retenção por intervalo (purge periódico pelo scheduler)
+
+from __future__ import annotations
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.models import PriceCandle
+
+logger = logging.getLogger(__name__)
+
+INTERVALS = {
+    "1m": timedelta(minutes=1),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+
+
+def bucket_start(ts: datetime, interval: str) -> datetime:
+    if interval == "1m":
+        return ts.replace(second=0, microsecond=0)
+    if interval == "1h":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# Grava uma amostra por moeda (top HISTORY_TOP_N do snapshot) nos 3 intervalos
+async def record_samples(db: AsyncSession, vs_currency: str, items: List[Dict[str, Any]], ts: Optional[datetime] = None) -> int:
+    ts = ts or datetime.now(timezone.utc)
+    # Uma linha por chave: id repetido no lote quebraria o ON CONFLICT ("cannot affect row a second time")
+    # Fica a primeira ocorrência (ordem do market cap)
+    rows: Dict[tuple, Dict[str, Any]] = {}
+    for it in items[: settings.HISTORY_TOP_N]:
+        price = it.get("current_price")
+        if not it.get("id") or price is None:
+            continue
+        for interval in INTERVALS:
+            key = (it["id"], vs_currency.lower(), interval, bucket_start(ts, interval))
+            rows.setdefault(key, {
+                "coin_id": key[0],
+                "vs_currency": key[1],
+                "interval": interval,
+                "bucket_start": key[3],
+                "open": price,
+                "high": price,
+                "low": price,
+                "close": price,
+            })
+    if not rows:
+        return 0
+
+    stmt = insert(PriceCandle).values(list(rows.values()))
+    # Candle já existe: mantém open, estende high/low e move o close
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["coin_id", "vs_currency", "interval", "bucket_start"],
+        set_={
+            "high": func.greatest(PriceCandle.high, stmt.excluded.high),
+            "low": func.least(PriceCandle.low, stmt.excluded.low),
+            "close": stmt.excluded.close,
+        },
+    )
+    await db.execute(stmt)
+    await db.commit()
+    return len(rows) // len(INTERVALS)
+
+
+async def read_history(
+    db: AsyncSession,
+    coin_id: str,
+    vs_currency: str,
+    interval: str,
+    start: datetime,
+    end: datetime,
+) -> List[Dict[str, Any]]:
+    rows = (await db.execute(
+        select(PriceCandle.bucket_start, PriceCandle.open, PriceCandle.high, PriceCandle.low, PriceCandle.close)
+        .where(
+            PriceCandle.coin_id == coin_id,
+            PriceCandle.vs_currency == vs_currency.lower(),
+            PriceCandle.interval == interval,
+            PriceCandle.bucket_start >= start,
+            PriceCandle.bucket_start <= end,
+        )
+        .order_by(PriceCandle.bucket_start)
+    )).all()
+    return [
+        {"t": b.isoformat(), "o": o, "h": h, "l": l, "c": c}
+        for b, o, h, l, c in rows
+    ]
+
+
+# Fechamentos por moeda em uma única consulta: {coin_id: [(epoch_s, close)]}
+async def read_closes(
+    db: AsyncSession,
+    coin_ids: List[str],
+    vs_currency: str,
+    interval: str,
+    start: datetime,
+) -> Dict[str, List[tuple[float, float]]]:
+    rows = (await db.execute(
+        select(PriceCandle.coin_id, PriceCandle.bucket_start, PriceCandle.close)
+        .where(
+            PriceCandle.coin_id.in_(coin_ids),
+            PriceCandle.vs_currency == vs_currency.lower(),
+            PriceCandle.interval == interval,
+            PriceCandle.bucket_start >= start,
+        )
+        .order_by(PriceCandle.coin_id, PriceCandle.bucket_start)
+    )).all()
+    out: Dict[str, List[tuple[float, float]]] = {}
+    for coin_id, b, close in rows:
+        out.setdefault(coin_id, []).append((b.timestamp(), close))
+    return out
+
+
+# Apaga candles fora da retenção de cada intervalo (0 = guarda para sempre)
+async def purge_history(db: AsyncSession) -> int:
+    now = datetime.now(timezone.utc)
+    retention = {
+        "1m": settings.HISTORY_RETENTION_1M_DAYS,
+        "1h": settings.HISTORY_RETENTION_1H_DAYS,
+        "1d": settings.HISTORY_RETENTION_1D_DAYS,
+    }
+    total = 0
+    for interval, days in retention.items():
+        if days <= 0:
+            continue
+        res = await db.execute(
+            delete(PriceCandle).where(
+                PriceCandle.interval == interval,
+                PriceCandle.bucket_start < now - timedelta(days=days),
+            )
+        )
+        total += res.rowcount or 0
+    await db.commit()
+    return total
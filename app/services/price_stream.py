@@ -0,0 +1,125 @@
+# Difusão de preços ao vivo (SSE / WebSocket)
+# - Cada atualização do snapshot de mercados vira UM "tick" por moeda de cotação
+# - O tick calcula só as moedas que mudaram e serializa cada uma UMA vez
+# - Cada cliente recebe o diff inteiro (bytes compartilhados) ou só as moedas que assinou
+
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Set
+from app.core.config import settings
+from app.core.fastjson import dumps as _dumps
+
+logger = logging.getLogger(__name__)
+
+# Campos enviados ao cliente (payload compacto)
+STREAM_FIELDS = (
+    "id",
+    "symbol",
+    "current_price",
+    "price_change_percentage_24h",
+    "market_cap",
+    "market_cap_rank",
+    "total_volume",
+)
+
+
+class Subscriber:
+    def __init__(self, vs_currency: str, coins: Optional[FrozenSet[str]], max_queue: int):
+        self.vs_currency = vs_currency
+        self.coins = coins
+        self.queue: asyncio.Queue[bytes] = asyncio.Queue(maxsize=max_queue)
+        self.resync = False  # fila estourou: próximo envio é o estado completo
+
+    def push(self, payload: bytes) -> None:
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            # Cliente lento: descarta o pendente e pede estado completo no próximo tick
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.resync = True
+
+
+class _Tick:
+    # Resultado de um tick: fragmentos JSON por moeda (estado e diff)
+    def __init__(self, ts: float, state: Dict[str, bytes], changed: List[str]):
+        self.ts = ts
+        self.state = state
+        self.changed = changed
+        self._full: Dict[str, bytes] = {}
+
+    def encode(self, vs_currency: str, kind: str, ids: List[str]) -> bytes:
+        body = b",".join(self.state[i] for i in ids if i in self.state)
+        head = _dumps({"type": kind, "vs_currency": vs_currency, "ts": self.ts})[:-1]
+        return head + b',"coins":[' + body + b"]}"
+
+    def shared(self, vs_currency: str, kind: str) -> bytes:
+        # Payload sem filtro: serializado uma vez e reutilizado por todos
+        if kind not in self._full:
+            ids = self.changed if kind == "delta" else list(self.state)
+            self._full[kind] = self.encode(vs_currency, kind, ids)
+        return self._full[kind]
+
+
+class PriceBroadcaster:
+    def __init__(self, max_queue: int = 16):
+        self.max_queue = max_queue
+        self._subs: Dict[str, Set[Subscriber]] = {}
+        self._last: Dict[str, Dict[str, tuple]] = {}
+        self._ticks: Dict[str, _Tick] = {}
+
+    def subscribe(self, vs_currency: str, coins: Optional[FrozenSet[str]] = None) -> Subscriber:
+        sub = Subscriber(vs_currency.lower(), coins, self.max_queue)
+        self._subs.setdefault(sub.vs_currency, set()).add(sub)
+        tick = self._ticks.get(sub.vs_currency)
+        if tick is not None:
+            sub.push(self._payload(tick, sub, "snapshot"))
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        self._subs.get(sub.vs_currency, set()).discard(sub)
+
+    def _payload(self, tick: _Tick, sub: Subscriber, kind: str) -> bytes:
+        if sub.coins is None:
+            return tick.shared(sub.vs_currency, kind)
+        ids = tick.changed if kind == "delta" else list(tick.state)
+        return tick.encode(sub.vs_currency, kind, [i for i in ids if i in sub.coins])
+
+    def publish(self, vs_currency: str, items: List[Dict[str, Any]]) -> int:
+        # Chamado a cada atualização do snapshot; devolve quantas moedas mudaram
+        vs_currency = vs_currency.lower()
+        prev = self._last.get(vs_currency, {})
+        current: Dict[str, tuple] = {}
+        state: Dict[str, bytes] = {}
+        changed: List[str] = []
+        old_state = self._ticks[vs_currency].state if vs_currency in self._ticks else {}
+        for it in items:
+            cid = it.get("id")
+            if not cid:
+                continue
+            values = tuple(it.get(f) for f in STREAM_FIELDS)
+            current[cid] = values
+            if prev.get(cid) != values:
+                changed.append(cid)
+                state[cid] = _dumps(dict(zip(STREAM_FIELDS, values)))
+            else:
+                state[cid] = old_state.get(cid) or _dumps(dict(zip(STREAM_FIELDS, values)))
+        self._last[vs_currency] = current
+        tick = _Tick(time.time(), state, changed)
+        self._ticks[vs_currency] = tick
+
+        for sub in list(self._subs.get(vs_currency, ())):
+            if sub.resync:
+                sub.resync = False
+                sub.push(self._payload(tick, sub, "snapshot"))
+            elif changed and (sub.coins is None or not sub.coins.isdisjoint(changed)):
+                sub.push(self._payload(tick, sub, "delta"))
+        return len(changed)
+
+    def stats(self) -> Dict[str, int]:
+        return {cur: len(subs) for cur, subs in self._subs.items()}
+
+
+price_broadcaster = PriceBroadcaster(max_queue=settings.PRICE_STREAM_MAX_QUEUE)
@@ -1,20 +1,180 @@
 # Tarefas agendadas com APScheduler.
-# Ex: job semanal (placeholder) — recomenda-se usar as automações do MailerLite para disparos reais.
 
+import logging
+from datetime import datetime, timezone
 from typing import Optional
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from app.db.database import SessionLocal
+from apscheduler.triggers.interval import IntervalTrigger
+from app.core.config import settings
+from sqlalchemy import delete, or_, select
+from app.db.database import AsyncSessionLocal
 from app.db import models
+from app.services.coingecko import refresh_coin_index, refresh_market_snapshots
+from app.services.digest import run_weekly_digest
+from app.services.mail_queue import dispatch_pending, purge_mail_queue
+from app.services.market_snapshot import market_snapshots
+from app.services.feeds import refresh_feeds
+from app.services.news_store import purge_news, refresh_news
+from app.services.newsletter_outbox import drain_outbox
+from app.services.price_history import purge_history, record_samples
+
+logger = logging.getLogger(__name__)
 
 scheduler: Optional[AsyncIOScheduler] = None
 
-# Placeholder: aqui você poderia montar um resumo semanal e acionar uma automação do MailerLite (recomendado).
-async def weekly_digest_job():
-    if SessionLocal:
-        with SessionLocal() as db:
-            _ = db.query(models.NewsletterSubscription).count()
-    return True
+# Digest semanal: envia (ou retoma) o resumo da semana para os inscritos
+async def weekly_digest_job(resume_only: bool = False):
+    if not (settings.DIGEST_ENABLED and AsyncSessionLocal):
+        return
+    try:
+        result = await run_weekly_digest(resume_only=resume_only)
+        if result:
+            logger.info("Digest semanal concluído: %s", result)
+    except Exception:
+        # O checkpoint fica no banco; a próxima rodada de retomada continua do último lote
+        logger.exception("Falha no digest semanal")
+
+# Atualiza o índice local de moedas (id/símbolo/autocomplete)
+async def coin_index_job():
+    try:
+        total = await refresh_coin_index()
+        logger.info("Índice de moedas atualizado (%d moedas)", total)
+    except Exception:
+        # Mantém o índice anterior; rotas caem para a API se ainda não houver índice
+        logger.exception("Falha ao atualizar índice de moedas")
+
+# Atualiza o snapshot top-N de mercados (custo fixo de chamadas por minuto)
+async def market_snapshot_job():
+    try:
+        done = await refresh_market_snapshots()
+        logger.info("Snapshot de mercados atualizado: %s", done)
+    except Exception:
+        # Mantém o snapshot anterior; /markets cai para o cache por página se envelhecer demais
+        logger.exception("Falha ao atualizar snapshot de mercados")
+        return
+    if settings.HISTORY_ENABLED and AsyncSessionLocal:
+        await _record_history(list(done))
+
+# Grava a amostra atual de cada moeda de cotação no histórico
+async def _record_history(currencies):
+    for cur in currencies:
+        snap = market_snapshots.get(cur)
+        if snap is None:
+            continue
+        try:
+            async with AsyncSessionLocal() as db:
+                await record_samples(db, cur, snap.items)
+        except Exception:
+            logger.exception("Falha ao gravar histórico de preços (%s)", cur)
+
+# Remove candles fora da retenção
+async def history_purge_job():
+    if not AsyncSessionLocal:
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            removed = await purge_history(db)
+        logger.info("Histórico de preços: %d candles removidos", removed)
+    except Exception:
+        logger.exception("Falha ao limpar histórico de preços")
+
+# Apaga tokens de reset usados ou expirados em lotes (transações curtas, sem travar a tabela)
+async def password_reset_purge_job():
+    if not AsyncSessionLocal:
+        return
+    now = datetime.now(timezone.utc)
+    batch = settings.RESET_PURGE_BATCH
+    total = 0
+    try:
+        async with AsyncSessionLocal() as db:
+            while True:
+                ids = (
+                    select(models.PasswordReset.id)
+                    .where(or_(models.PasswordReset.used_at.is_not(None), models.PasswordReset.expires_at <= now))
+                    .limit(batch)
+                )
+                res = await db.execute(
+                    delete(models.PasswordReset).where(models.PasswordReset.id.in_(ids.scalar_subquery()))
+                )
+                await db.commit()
+                total += res.rowcount or 0
+                if (res.rowcount or 0) < batch:
+                    break
+        logger.info("Tokens de reset removidos: %d", total)
+    except Exception:
+        logger.exception("Falha ao limpar tokens de reset")
+
+# Envia as inscrições pendentes da newsletter para a MailerLite
+async def newsletter_outbox_job():
+    if not AsyncSessionLocal:
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            counts = await drain_outbox(db)
+        if any(counts.values()):
+            logger.info("Newsletter outbox: %s", counts)
+    except Exception:
+        logger.exception("Falha ao sincronizar newsletter com a MailerLite")
+
+# Entrega os e-mails pendentes da fila
+async def mail_dispatch_job():
+    if not AsyncSessionLocal:
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            counts = await dispatch_pending(db)
+        if any(counts.values()):
+            logger.info("Fila de e-mails: %s", counts)
+    except Exception:
+        logger.exception("Falha ao processar fila de e-mails")
+
+# Remove da fila os e-mails já finalizados (retenção) e os de reset com token expirado
+async def mail_purge_job():
+    if not AsyncSessionLocal:
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            removed = await purge_mail_queue(db)
+        logger.info("Fila de e-mails: %d mensagens antigas removidas", removed)
+    except Exception:
+        logger.exception("Falha ao limpar fila de e-mails")
+
+# Busca notícias novas (uma chamada por idioma) e atualiza o acervo
+async def news_refresh_job():
+    try:
+        if AsyncSessionLocal:
+            async with AsyncSessionLocal() as db:
+                added = await refresh_news(db)
+        else:
+            added = await refresh_news(None)
+        logger.info("Acervo de notícias atualizado: %s", added)
+    except Exception:
+        logger.exception("Falha ao atualizar acervo de notícias")
+
+# Lê os feeds RSS/Atom configurados (GET condicional) e soma as entradas novas ao acervo
+async def news_feeds_job():
+    try:
+        if AsyncSessionLocal:
+            async with AsyncSessionLocal() as db:
+                added = await refresh_feeds(db)
+        else:
+            added = await refresh_feeds(None)
+        if any(added.values()):
+            logger.info("Feeds de notícias: %s", added)
+    except Exception:
+        logger.exception("Falha ao atualizar feeds de notícias")
+
+# Remove notícias fora da retenção
+async def news_purge_job():
+    if not AsyncSessionLocal:
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            removed = await purge_news(db)
+        logger.info("Acervo de notícias: %d notícias antigas removidas", removed)
+    except Exception:
+        logger.exception("Falha ao limpar acervo de notícias")
 
 # Inicia o scheduler se ainda não estiver rodando
 async def start_scheduler():
@@ -24,6 +184,66 @@ async def start_scheduler():
     scheduler = AsyncIOScheduler(timezone="UTC")
     # Toda segunda às 12:00 UTC
     scheduler.add_job(weekly_digest_job, CronTrigger(day_of_week="mon", hour=12, minute=0))
+    # Retoma um digest interrompido (queda/restart) a partir do último checkpoint
+    scheduler.add_job(
+        weekly_digest_job,
+        IntervalTrigger(minutes=settings.DIGEST_RESUME_INTERVAL_MIN),
+        kwargs={"resume_only": True},
+        max_instances=1,
+        coalesce=True,
+    )
+    # Índice de moedas: roda já no startup e depois a cada COIN_INDEX_REFRESH_MIN
+    scheduler.add_job(
+        coin_index_job,
+        IntervalTrigger(minutes=settings.COIN_INDEX_REFRESH_MIN),
+        next_run_time=datetime.now(timezone.utc),
+    )
+    scheduler.add_job(
+        market_snapshot_job,
+        IntervalTrigger(seconds=settings.MARKET_SNAPSHOT_INTERVAL_SEC),
+        next_run_time=datetime.now(timezone.utc),
+        max_instances=1,
+        coalesce=True,
+    )
+    # Retenção do histórico: todo dia às 03:30 UTC
+    scheduler.add_job(history_purge_job, CronTrigger(hour=3, minute=30))
+    scheduler.add_job(
+        password_reset_purge_job,
+        IntervalTrigger(minutes=settings.RESET_PURGE_INTERVAL_MIN),
+        max_instances=1,
+        coalesce=True,
+    )
+    scheduler.add_job(
+        newsletter_outbox_job,
+        IntervalTrigger(seconds=settings.NEWSLETTER_SYNC_INTERVAL_SEC),
+        max_instances=1,
+        coalesce=True,
+    )
+    scheduler.add_job(
+        mail_dispatch_job,
+        IntervalTrigger(seconds=settings.MAIL_DISPATCH_INTERVAL_SEC),
+        next_run_time=datetime.now(timezone.utc),
+        max_instances=1,
+        coalesce=True,
+    )
+    scheduler.add_job(mail_purge_job, CronTrigger(minute=45))  # de hora em hora: resets saem logo após expirar
+    # Notícias: já no startup e depois em intervalo fixo (consumo da NewsAPI independe do tráfego)
+    scheduler.add_job(
+        news_refresh_job,
+        IntervalTrigger(minutes=settings.NEWS_REFRESH_MIN),
+        next_run_time=datetime.now(timezone.utc),
+        max_instances=1,
+        coalesce=True,
+    )
+    if settings.NEWS_FEEDS:
+        scheduler.add_job(
+            news_feeds_job,
+            IntervalTrigger(minutes=settings.NEWS_FEEDS_REFRESH_MIN),
+            next_run_time=datetime.now(timezone.utc),
+            max_instances=1,
+            coalesce=True,
+        )
+    scheduler.add_job(news_purge_job, CronTrigger(hour=4, minute=0))
     scheduler.start()
 
 # Para o scheduler no encerramento da aplicação
@@ -1,26 +1,52 @@
 # Dependências comuns (ex.: pegar usuário atual a partir do JWT no header Authorization)
 
+import uuid
+
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
+from app.core.principal_cache import MISSING, Principal, principal_cache
 from app.core.security import decode_token
-from app.db.database import get_db
+from app.db.database import get_async_db
 from app.db import models
 
 bearer = HTTPBearer(auto_error=False)
 
-# Lê o token JWT do header Authorization (Bearer) e busca o usuário no banco
+# Lê o token JWT do header Authorization (Bearer) e devolve o usuário (Principal: id, email, name)
+# O usuário vem do cache; o banco só é consultado em cache miss
 # Se não encontrar ou token inválido -> 401
-def get_current_user(creds: HTTPAuthorizationCredentials = Depends(bearer), db: Session = Depends(get_db)) -> models.User:
+async def get_current_user(
+    creds: HTTPAuthorizationCredentials = Depends(bearer),
+    db: AsyncSession = Depends(get_async_db),
+) -> Principal:
     if not creds or not creds.credentials:
         raise HTTPException(status_code=401, detail="Missing token")
     try:
         payload = decode_token(creds.credentials)
-        user_id = payload.get("sub")
+        user_id = str(uuid.UUID(str(payload.get("sub"))))
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid token")
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
+
+    principal = await principal_cache.get(user_id)
+    if principal is MISSING:
+        row = (
+            await db.execute(
+                select(models.User.id, models.User.email, models.User.name)
+                .where(models.User.id == uuid.UUID(user_id))
+            )
+        ).first()
+        principal = Principal(id=row.id, email=row.email, name=row.name) if row else None
+        await principal_cache.put(user_id, principal)
+    if principal is None:
         raise HTTPException(status_code=401, detail="User not found")
+    return principal
+
+
+# Usuário logado que também está em ADMIN_EMAILS; senão -> 403
+async def get_admin_user(user: Principal = Depends(get_current_user)) -> Principal:
+    if (user.email or "").lower() not in settings.ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Forbidden")
     return user